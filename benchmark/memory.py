@@ -0,0 +1,75 @@
+"""The memory used to load the 'SiteInfo' for every site in the estate.
+
+'peak' is the most memory used while the sites were being loaded and
+'retained' is the memory still in use when we have the list of 'SiteInfo'
+objects (including anything the code caches e.g. the parsed pillar files).
+
+The estate is loaded with 'lib.server.get_live_sites'.  Older versions of
+the code don't have it, so we create a 'SiteInfo' for each site.  To compare
+with another version of the code (e.g. before a change), check it out into
+another folder and pass the folder as 'tree' e.g::
+
+  git worktree add ../before <commit>
+  python -m benchmark.memory 100 10 ../before
+
+Usage::
+
+  python -m benchmark.memory [minions] [sites] [tree]
+
+"""
+import gc
+import shutil
+import sys
+import tempfile
+
+from benchmark.pillar import create_pillar
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def _estate_loader():
+    """Returns a function which loads the 'SiteInfo' for every site."""
+    try:
+        from lib.server import get_live_sites
+    except ImportError:
+        from lib.siteinfo import SiteInfo
+        return lambda folder, sites: [
+            SiteInfo(minion_id, domain, folder) for minion_id, domain in sites
+        ]
+    return lambda folder, sites: get_live_sites(folder)
+
+
+def main(minions=100, sites=10, tree=None):
+    if tracemalloc is None:
+        print('The memory benchmark needs python 3 (tracemalloc)')
+        return
+    if tree:
+        # import 'lib' from the other version of the code
+        sys.path.insert(0, tree)
+    load_estate = _estate_loader()
+    folder = tempfile.mkdtemp()
+    try:
+        sites = create_pillar(folder, int(minions), int(sites))
+        gc.collect()
+        tracemalloc.start()
+        try:
+            site_infos = load_estate(folder, sites)
+            gc.collect()
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        count = len(site_infos)
+        print('{} sites'.format(count))
+        for name, size in (('peak', peak), ('retained', retained)):
+            print('{:<9} {:>12,} bytes ({:,} bytes per site)'.format(
+                name + ':', size, size // count
+            ))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
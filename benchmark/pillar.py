@@ -0,0 +1,79 @@
+"""Generate a large salt pillar for the benchmarks.
+
+The layout matches the pillar on our workstations i.e. a 'top.sls' with
+one entry per minion, the global config files and a 'sites' file for each
+minion.
+
+"""
+import os
+
+
+SITE = """  {domain}:
+    profile: django
+    db_pass: {password}
+    db_type: psql
+    domain: {domain}.example.com
+    mailgun_receive: True
+    package: {package}
+    secret_key: '{password}{port}'
+    ssl: True
+    uwsgi_port: {port}
+    celery: True
+    backup:
+      path: /home/web/repo/files/{domain}
+    env:
+      norecaptcha_site_key: abc{port}
+      norecaptcha_secret_key: def{port}
+    mail:
+      mail_template_type: django
+"""
+
+
+def _write(file_name, text):
+    folder = os.path.dirname(file_name)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(file_name, 'w') as f:
+        f.write(text)
+
+
+def create_pillar(folder, minions=100, sites=10):
+    """Create a pillar with 'minions' servers each hosting 'sites' sites.
+
+    Returns a list of '(minion_id, domain)' for the sites.
+
+    """
+    result = []
+    _write(os.path.join(folder, 'config', 'django.sls'), 'django:\n  True\n')
+    _write(
+        os.path.join(folder, 'global', 'pip.sls'),
+        'pip:\n  prefix: pkimber\n  pypirc: dev\n',
+    )
+    top = ['base:']
+    for minion in range(minions):
+        minion_id = 'web-{:03d}'.format(minion)
+        top.append("  '{}':".format(minion_id))
+        top.append('    - config.django')
+        top.append('    - global.pip')
+        top.append('    - db.{}.settings'.format(minion))
+        top.append('    - sites.{}'.format(minion))
+        _write(
+            os.path.join(folder, 'db', str(minion), 'settings.sls'),
+            'postgres_settings:\n  listen_address: localhost\n',
+        )
+        text = ['sites:']
+        for site in range(sites):
+            domain = 'site_{:03d}_{:02d}'.format(minion, site)
+            result.append((minion_id, domain))
+            text.append(SITE.format(
+                domain=domain,
+                package=domain.replace('_', '-'),
+                password='pass{}{}'.format(minion, site),
+                port=3000 + site,
+            ))
+        _write(
+            os.path.join(folder, 'sites', '{}.sls'.format(minion)),
+            '\n'.join(text),
+        )
+    _write(os.path.join(folder, 'top.sls'), '\n'.join(top) + '\n')
+    return result
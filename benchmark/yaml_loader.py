@@ -0,0 +1,53 @@
+"""Compare the pure python and libyaml loaders on a generated pillar.
+
+Usage::
+
+  python -m benchmark.yaml_loader [minions] [sites]
+
+"""
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+import yaml
+
+from benchmark.pillar import create_pillar
+
+
+def _parse_all(file_names, loader):
+    start = time.time()
+    for file_name in file_names:
+        with open(file_name, 'r') as f:
+            yaml.load(f, Loader=loader)
+    return time.time() - start
+
+
+def main(minions=100, sites=10):
+    folder = tempfile.mkdtemp()
+    try:
+        create_pillar(folder, minions, sites)
+        file_names = glob.glob(os.path.join(folder, '*.sls'))
+        file_names = file_names + glob.glob(
+            os.path.join(folder, '*', '*.sls')
+        )
+        file_names = file_names + glob.glob(
+            os.path.join(folder, '*', '*', '*.sls')
+        )
+        print('{} sls files ({} sites)'.format(len(file_names), minions * sites))
+        python = _parse_all(file_names, yaml.SafeLoader)
+        print('SafeLoader:  {:.3f} seconds'.format(python))
+        if yaml.__with_libyaml__:
+            c = _parse_all(file_names, yaml.CSafeLoader)
+            print('CSafeLoader: {:.3f} seconds ({:.1f}x faster)'.format(
+                c, python / c
+            ))
+        else:
+            print('PyYAML was not built with libyaml (no CSafeLoader)')
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
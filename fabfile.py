@@ -1,4 +1,6 @@
 # -*- encoding: utf-8 -*-
+import os
+
 from datetime import datetime
 
 from fabric.api import (
@@ -32,22 +34,39 @@ from lib.deploy import (
     run_post_deploy_test,
 )
 from lib.folder import get_pillar_folder
-from lib.duplicity import Duplicity
+from lib.duplicity import (
+    catalogs,
+    Duplicity,
+)
+from lib.collection import format_time
 from lib.command import DjangoCommand
 from lib.postgres import (
     database_name,
-    drop_remote_database,
-    drop_remote_user,
     local_database_exists,
     local_user_exists,
-    remote_database_create,
-    remote_database_exists,
-    remote_user_create,
-    remote_user_exists,
+    remote_create_db,
+    remote_create_dbs,
+    remote_database_size,
+    remote_drop_db,
+    remote_drop_user,
 )
 from lib.folder import FolderInfo
-from lib.server import get_server_name
+from lib.metrics import (
+    format_bytes,
+    Phases,
+    read_metrics,
+    summary,
+)
+from lib.pillar import use_snapshot
+from lib.server import (
+    get_live_sites,
+    get_postgres_sites,
+    get_server_name,
+)
 from lib.siteinfo import SiteInfo
+from lib.validate import validate_all
+from lib.watch import PillarWatcher
+from lib.workspace import WORKSPACE_KEEP
 
 
 FILES = 'files'
@@ -55,6 +74,11 @@ POSTGRES = 'postgres'
 env.use_ssh_config = False
 
 
+def _is_true(value):
+    """fabric passes task parameters as strings e.g. 'fast=False'."""
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
 @task
 def backup_files():
     """
@@ -65,10 +89,15 @@ def backup_files():
     name = env.host_string.replace('.', '_')
     name = name.replace('-', '_')
     path = Path(name, 'files')
+    phases = Phases('backup files', name)
     run('mkdir -p {0}'.format(path.remote_folder()))
-    with cd(path.files_folder()), hide('stdout'):
-        run('tar -czf {} .'.format(path.remote_file()))
-    get(path.remote_file(), path.local_file())
+    with phases.phase('archive'):
+        with cd(path.files_folder()), hide('stdout'):
+            run('tar -czf {} .'.format(path.remote_file()))
+    with phases.phase('download') as record:
+        get(path.remote_file(), path.local_file())
+        record['bytes'] = os.path.getsize(path.local_file())
+    phases.write()
 
 
 @task
@@ -77,10 +106,15 @@ def backup_ftp():
         abort("'{}' is not set-up for 'ftp'".format(env.site_info.site_name))
     print(green("Backup FTP files on '{}'").format(env.host_string))
     path = Path(env.site_info.site_name, 'ftp')
+    phases = Phases('backup ftp', env.site_info.site_name)
     run('mkdir -p {0}'.format(path.remote_folder()))
-    with cd(path.ftp_folder(env.site_info.site_name)):
-        run('tar -cvzf {} .'.format(path.remote_file()))
-    get(path.remote_file(), path.local_file())
+    with phases.phase('archive'):
+        with cd(path.ftp_folder(env.site_info.site_name)):
+            run('tar -cvzf {} .'.format(path.remote_file()))
+    with phases.phase('download') as record:
+        get(path.remote_file(), path.local_file())
+        record['bytes'] = os.path.getsize(path.local_file())
+    phases.write()
 
 
 @task
@@ -110,9 +144,14 @@ def backup_php_site(server_name, site_name):
     #  run('gzip {}'.format(tar_file))
     #  # list the contents of the archive
     #  run('tar ztvf {}'.format(path.remote_file()))
-    with cd(backup_path):
-        run('tar -cvzf {} .'.format(path.remote_file()))
-    get(path.remote_file(), path.local_file())
+    phases = Phases('backup files', site_name)
+    with phases.phase('archive'):
+        with cd(backup_path):
+            run('tar -cvzf {} .'.format(path.remote_file()))
+    with phases.phase('download') as record:
+        get(path.remote_file(), path.local_file())
+        record['bytes'] = os.path.getsize(path.local_file())
+    phases.write()
 
 
 @task
@@ -155,12 +194,44 @@ def create_db(table_space=None, workflow=None):
         )
         run('mysql -u root -e "{}"'.format(command), shell=False)
     else:
-        if not remote_user_exists(env.site_info):
-            remote_user_create(env.site_info)
-        remote_database_create(env.site_info, table_space, workflow)
+        remote_create_db(env.site_info, table_space, workflow)
     print(green('done'))
 
 
+@task
+def create_dbs(minion_id, table_space=None, dry_run=None, chunk_size=10):
+    """Create the missing roles and databases for every postgres site.
+
+    e.g:
+    fab -H drop-temp create_dbs:drop-temp,dry_run=True
+    fab -H drop-temp create_dbs:drop-temp,chunk_size=5
+
+    'chunk_size' is the number of sites created in each 'psql' session.
+    """
+    dry_run = _is_true(dry_run)
+    pillar_folder = get_pillar_folder()
+    use_snapshot(pillar_folder)
+    site_infos = get_postgres_sites(pillar_folder, minion_id)
+    print(green("create databases for {} site(s) on '{}'").format(
+        len(site_infos), env.host_string
+    ))
+    missing = remote_create_dbs(
+        site_infos, table_space, dry_run, chunk_size
+    )
+    for site_info, create_user, create_database in missing:
+        if create_user:
+            print(yellow("+ role '{}'".format(site_info.db_name)))
+        if create_database:
+            print(yellow("+ database '{}'".format(site_info.db_name)))
+    print(green("{} site(s) already have a role and database").format(
+        len(site_infos) - len(missing)
+    ))
+    if dry_run:
+        print(yellow("dry run: nothing was created"))
+    else:
+        print(green('done'))
+
+
 @task
 def create_db_workflow(table_space=None):
     return create_db(table_space=table_space, workflow=True)
@@ -205,6 +276,9 @@ def drop_db(date_check=None, workflow=None):
     db_name = database_name(env.site_info, workflow)
     print(green("drop '{}' database on '{}'").format(db_name, env.host_string))
     if check == date_check:
+        size = remote_database_size(env.site_info, workflow)
+        if size is not None:
+            print(yellow("'{}' is {}".format(db_name, format_bytes(size))))
         message = "Are you sure you want to drop '{}' on '{}'?".format(
             database_name, env.host_string
         )
@@ -217,8 +291,10 @@ def drop_db(date_check=None, workflow=None):
         confirm = prompt("Are you sure you want to drop the database (Y/N)?")
         if confirm == 'Y':
             print('deleting...')
-            if remote_database_exists(env.site_info, workflow):
-                drop_remote_database(env.site_info, workflow)
+            if remote_drop_db(env.site_info, workflow):
+                print("deleted '{}'".format(db_name))
+            else:
+                print("Cannot delete '{}'.  It does not exist.".format(db_name))
         else:
             abort("exit... (you did not enter 'Y' to drop the database)")
     else:
@@ -231,9 +307,8 @@ def drop_db(date_check=None, workflow=None):
 def drop_db_role():
     print(green("drop '{}' database role").format(env.site_info.db_name))
     db_name = env.site_info.db_name
-    if remote_user_exists(env.site_info):
-        print('deleting...')
-        drop_remote_user(env.site_info)
+    print('deleting...')
+    if remote_drop_user(env.site_info):
         print("deleted '{}'".format(db_name))
     else:
         print("Cannot delete '{}' role.  It does not exist.".format(db_name))
@@ -245,9 +320,48 @@ def drop_db_workflow(date_check=None):
 
 
 @task
-def list_current(backup_or_files):
+def list_current(backup_or_files, refresh=None):
+    """List the backup sets e.g:
+
+    fab domain:hatherleigh_info list_current:backup
+    fab domain:hatherleigh_info list_current:files,refresh=True
+    """
     duplicity = Duplicity(env.site_info, backup_or_files)
-    duplicity.list_current()
+    duplicity.list_current(_is_true(refresh))
+
+
+@task
+def list_current_all(backup_or_files='backup', processes=8, refresh=None):
+    """List the newest backup set for every live site e.g:
+
+    fab list_current_all
+    fab list_current_all:files,processes=4,refresh=True
+    """
+    pillar_folder = get_pillar_folder()
+    use_snapshot(pillar_folder)
+    site_infos = get_live_sites(pillar_folder)
+    if backup_or_files == 'backup':
+        site_infos = [
+            site_info for site_info in site_infos
+            if site_info.is_postgres or site_info.is_mysql
+        ]
+    result = catalogs(
+        site_infos, backup_or_files, int(processes), _is_true(refresh)
+    )
+    for domain, catalog, error in result:
+        if error:
+            print(red("{}: {}".format(domain, error)))
+        elif catalog.sets():
+            newest = catalog.find(-1)
+            print("{}: {} {} ({} set(s), {} volume(s))".format(
+                domain,
+                format_time(newest['time']),
+                newest['type'],
+                len(catalog.sets()),
+                catalog.volumes(),
+            ))
+        else:
+            print(yellow("{}: no backups".format(domain)))
 
 
 @task
@@ -267,11 +381,60 @@ def reindex():
 
 
 @task
-def restore(backup_or_files):
-    duplicity = Duplicity(env.site_info, backup_or_files)
+def restore(
+        backup_or_files, jobs=None, stream=None, template=None, fast=None,
+        path=None, time=None, keep=None, backup_set=None):
+    """Restore the database or files from the duplicity backup e.g:
+
+    fab domain:hatherleigh_info restore:backup
+    fab domain:hatherleigh_info restore:backup,jobs=4
+    fab domain:hatherleigh_info restore:backup,stream=True
+    fab domain:hatherleigh_info restore:backup,template=True
+    fab domain:hatherleigh_info restore:backup,fast=True
+    fab domain:hatherleigh_info restore:files,path=public/booking
+    fab domain:hatherleigh_info restore:files,time=2015-01-24
+    fab domain:hatherleigh_info restore:backup,backup_set=-2
+
+    'time' is passed to the duplicity '--time' option.  'keep' is the
+    number of restore folders to keep (for debugging).  'backup_set' is
+    the number of a backup set from 'list_current' ('-1' is the newest).
+    """
+    duplicity = Duplicity(
+        env.site_info,
+        backup_or_files,
+        jobs,
+        stream=_is_true(stream),
+        template=_is_true(template),
+        fast=_is_true(fast),
+        path_filter=path,
+        time=time,
+        keep=WORKSPACE_KEEP if keep is None else keep,
+        backup_set=backup_set,
+    )
     duplicity.restore()
 
 
+@task
+def restore_summary(backup_or_files='backup', count=20):
+    """Rank the sites by the average time taken to restore them e.g:
+
+    fab restore_summary
+    fab restore_summary:files,count=5
+    """
+    sites = summary(read_metrics(), 'restore {}'.format(backup_or_files))
+    if not sites:
+        print(yellow("No restores have been recorded"))
+    for site in sites[:int(count)]:
+        line = '{}: {:.1f} seconds (max {:.1f}, {} restore(s))'.format(
+            site['site'], site['seconds'], site['max_seconds'], site['count']
+        )
+        if 'bytes' in site:
+            line = line + ', {}'.format(format_bytes(site['bytes']))
+        if 'rows' in site:
+            line = line + ', {:,} rows'.format(site['rows'])
+        print(line)
+
+
 @task
 def haystack_index_clear(prefix, name):
     """
@@ -311,6 +474,7 @@ def setup(domain):
     print(green("domain: {}".format(domain)))
     # find the server name for this site
     pillar_folder = get_pillar_folder()
+    use_snapshot(pillar_folder)
     minion_id = get_server_name(pillar_folder, domain)
     print(yellow("minion_id: {}".format(minion_id)))
     env.site_info = SiteInfo(minion_id, domain)
@@ -341,6 +505,41 @@ def valid():
     )
 
 
+@task
+def valid_all():
+    """Check the pillar for every minion e.g:
+
+    fab valid_all
+    """
+    pillar_folder = get_pillar_folder()
+    use_snapshot(pillar_folder)
+    errors = validate_all(pillar_folder)
+    for minion_id, message in errors:
+        print(red("{}: {}".format(minion_id, message)))
+    if errors:
+        abort("The pillar for {} minion(s) is not valid".format(len(errors)))
+    print(green("The pillar appears to be valid"))
+
+
+@task
+def valid_watch(interval=1):
+    """Check the pillar every time an 'sls' file changes e.g:
+
+    fab valid_watch
+    """
+    def report(view):
+        print(yellow("pillar version {} (checked {})".format(
+            view.version, ', '.join(view.changed) or 'nothing'
+        )))
+        for minion_id, message in view.errors:
+            print(red("{}: {}".format(minion_id, message)))
+        if view.is_valid:
+            print(green("The pillar appears to be valid"))
+
+    pillar_folder = get_pillar_folder()
+    PillarWatcher(pillar_folder).watch(report, float(interval))
+
+
 @task
 def solr_status():
     print(green("SOLR status: '{0}'").format(env.host_string))
@@ -1,7 +1,6 @@
 # import json
 import os
 import requests
-import yaml
 import xmltodict
 
 from fabric.colors import (
@@ -14,6 +13,7 @@ from selenium.webdriver.support.wait import TimeoutException
 
 from lib.folder import get_test_folder
 from lib.error import TaskError
+from lib.yaml_loader import yaml_load
 # from lib.siteinfo import SiteInfo
 
 
@@ -68,7 +68,7 @@ class BrowserDriver(object):
 
     def _load(self, file_name):
         with open(file_name, 'r') as f:
-            data = yaml.load(f)
+            data = yaml_load(f)
         return data
 
     def _load_sitemap(self):
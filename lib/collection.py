@@ -0,0 +1,183 @@
+# -*- encoding: utf-8 -*-
+"""The backup sets in a duplicity collection.
+
+'duplicity collection-status' lists the backup chains in a collection.  Each
+chain starts with a full backup followed by incremental backups e.g::
+
+  Found primary backup chain with matching signature chain:
+  -------------------------
+  Chain start time: Sat Jan 24 01:00:04 2015
+  Chain end time: Sun Jan 25 01:00:02 2015
+  Number of contained backup sets: 2
+  Total number of contained volumes: 4
+   Type of backup set:                            Time:      Num volumes:
+                  Full         Sat Jan 24 01:00:04 2015                 3
+           Incremental         Sun Jan 25 01:00:02 2015                 1
+  -------------------------
+
+The output is parsed into a 'BackupCatalog' which is cached (as JSON) for
+'CATALOG_TTL' seconds, so we can choose a backup set to restore without
+asking the backup server again.
+
+"""
+import json
+import os
+import re
+import time
+
+from datetime import datetime
+
+from lib.error import TaskError
+from lib.folder import (
+    get_cache_folder,
+    write_atomic,
+)
+
+
+# one hour
+CATALOG_TTL = 60 * 60
+
+BACKUP_SET = re.compile(
+    r'^\s*(?P<type>Full|Incremental)\s+'
+    r'(?P<time>\w{3} \w{3} [ \d]\d \d\d:\d\d:\d\d \d{4})\s+'
+    r'(?P<volumes>\d+)\s*$'
+)
+CHAIN_START = re.compile(
+    r'^(Found primary backup chain|Secondary chain \d+ of \d+)'
+)
+
+
+def _parse_time(text):
+    """The time from 'collection-status' as seconds since the epoch.
+
+    duplicity displays the local time.
+
+    """
+    text = ' '.join(text.split())
+    return int(time.mktime(
+        datetime.strptime(text, '%a %b %d %H:%M:%S %Y').timetuple()
+    ))
+
+
+def format_time(seconds):
+    return datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def parse_collection_status(out):
+    """The backup chains from the output of 'duplicity collection-status'.
+
+    Returns a list of chains.  Each chain is a dict with 'primary' and a
+    list of backup 'sets' (each with a 'type', 'time' and 'volumes').
+
+    """
+    result = []
+    chain = None
+    for line in out.splitlines():
+        match = CHAIN_START.match(line.strip())
+        if match:
+            chain = dict(
+                primary=line.strip().startswith('Found primary'),
+                sets=[],
+            )
+            result.append(chain)
+            continue
+        match = BACKUP_SET.match(line)
+        if match and chain is not None:
+            chain['sets'].append(dict(
+                time=_parse_time(match.group('time')),
+                type=match.group('type').lower(),
+                volumes=int(match.group('volumes')),
+            ))
+    return [chain for chain in result if chain['sets']]
+
+
+class BackupCatalog(object):
+    """The backup chains and sets for a site."""
+
+    def __init__(self, chains, created=None):
+        self.chains = chains
+        self.created = created or time.time()
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['chains'], data['created'])
+
+    def as_dict(self):
+        return dict(chains=self.chains, created=self.created)
+
+    def find(self, index):
+        """Choose a backup set e.g. '-1' is the newest, '0' is the oldest."""
+        sets = self.sets()
+        try:
+            return sets[int(index)]
+        except (IndexError, TypeError, ValueError):
+            if not sets:
+                raise TaskError(
+                    "Cannot find backup set '{}' (there are no backup "
+                    "sets)".format(index)
+                )
+            raise TaskError(
+                "Cannot find backup set '{}'.  There are {} backup sets "
+                "('0' to '{}' or '-1' for the newest)".format(
+                    index, len(sets), len(sets) - 1
+                )
+            )
+
+    def full_sets(self):
+        return [item for item in self.sets() if item['type'] == 'full']
+
+    def is_stale(self, ttl=CATALOG_TTL):
+        return time.time() - self.created > ttl
+
+    def lines(self):
+        """A line of text for each backup set (for the report)."""
+        result = []
+        for count, item in enumerate(self.sets()):
+            result.append('{:>3}. {} {:<11} {} volume(s)'.format(
+                count,
+                format_time(item['time']),
+                item['type'],
+                item['volumes'],
+            ))
+        return result
+
+    def sets(self):
+        """All the backup sets (oldest first)."""
+        result = []
+        for chain in self.chains:
+            result = result + chain['sets']
+        return sorted(result, key=lambda item: item['time'])
+
+    def volumes(self):
+        return sum(item['volumes'] for item in self.sets())
+
+
+class CatalogCache(object):
+    """A 'BackupCatalog' for each site and collection (on the local disk)."""
+
+    def __init__(self, folder=None, ttl=CATALOG_TTL):
+        self.folder = folder or get_cache_folder('duplicity')
+        self.ttl = ttl
+
+    def _file_name(self, domain, backup_or_files):
+        return os.path.join(
+            self.folder, '{}.{}.json'.format(domain, backup_or_files)
+        )
+
+    def get(self, domain, backup_or_files):
+        """The catalog (or 'None' if we don't have it or it is too old)."""
+        try:
+            with open(self._file_name(domain, backup_or_files)) as f:
+                catalog = BackupCatalog.from_dict(json.load(f))
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        if catalog.is_stale(self.ttl):
+            return None
+        return catalog
+
+    def put(self, domain, backup_or_files, catalog):
+        data = catalog.as_dict()
+        write_atomic(
+            self._file_name(domain, backup_or_files),
+            lambda f: json.dump(data, f, indent=2, sort_keys=True),
+        )
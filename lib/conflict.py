@@ -0,0 +1,95 @@
+"""Find settings which must be unique across the estate.
+
+The 'ConflictIndex' is built in one pass over every site in the pillar and
+maps each uWSGI port (per minion), database name and database user to the
+sites which use it.
+
+A uWSGI port only needs to be unique on a minion and 'SiteInfo' already
+checks the sites on a minion, so the ports are not reported by 'conflicts'
+(they are used to find a free port for a new site e.g. 'is_port_free').
+
+"""
+import collections
+
+
+class Conflict(collections.namedtuple('Conflict', 'setting value owners')):
+    """A setting used by more than one '(minion_id, domain)'."""
+
+    __slots__ = ()
+
+    def message(self):
+        return "'{}' {} is used by more than one site: {}".format(
+            self.setting,
+            self.value,
+            ', '.join(
+                '{} ({})'.format(domain, minion_id)
+                for minion_id, domain in self.owners
+            ),
+        )
+
+    def minions(self):
+        return sorted(set(minion_id for minion_id, domain in self.owners))
+
+
+def _port(value):
+    """The pillar has uWSGI ports as numbers and strings e.g. '3031'."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class ConflictIndex(object):
+
+    def __init__(self, pillar_index):
+        self._db_name = {}
+        self._db_user = {}
+        self._uwsgi_port = {}
+        for minion_id in pillar_index.minions():
+            sites = pillar_index.pillar(minion_id).get('sites') or {}
+            for domain, settings in sites.items():
+                self._add_site(minion_id, domain, settings)
+
+    def _add(self, data, key, minion_id, domain):
+        data.setdefault(key, set()).add((minion_id, domain))
+
+    def _add_site(self, minion_id, domain, settings):
+        owner = (minion_id, domain)
+        profile = settings.get('profile')
+        if profile not in ('mattermost', 'php', 'apache_php'):
+            if 'uwsgi_port' in settings:
+                port = _port(settings['uwsgi_port'])
+                self._add(self._uwsgi_port, (minion_id, port), *owner)
+        if settings.get('db_type') in ('psql', 'mysql'):
+            db_name = domain.replace('.', '_')
+            self._add(self._db_name, db_name, *owner)
+            db_user = settings.get('db_user') or db_name
+            self._add(self._db_user, db_user, *owner)
+
+    def _conflicts(self, setting, data):
+        result = []
+        for value, owners in data.items():
+            # the same site on a live and a testing minion is not a conflict
+            domains = set(domain for minion_id, domain in owners)
+            if len(domains) > 1:
+                result.append(Conflict(setting, value, sorted(owners)))
+        return result
+
+    def conflicts(self):
+        """The database names and users used by more than one site."""
+        result = self._conflicts('db_name', self._db_name)
+        result = result + self._conflicts('db_user', self._db_user)
+        return sorted(result, key=lambda c: (c.setting, str(c.value)))
+
+    def db_name_owners(self, db_name):
+        return sorted(self._db_name.get(db_name, []))
+
+    def db_user_owners(self, db_user):
+        return sorted(self._db_user.get(db_user, []))
+
+    def is_port_free(self, minion_id, port):
+        """Is the uWSGI port free on the minion (for a new site)?"""
+        return (minion_id, _port(port)) not in self._uwsgi_port
+
+    def port_owners(self, minion_id, port):
+        return sorted(self._uwsgi_port.get((minion_id, _port(port)), []))
@@ -14,6 +14,7 @@ from fabric.colors import (
 )
 from walkdir import filtered_walk
 from lib.scm import Scm
+from lib.yaml_loader import yaml_load
 
 
 FILENAME_SETUP_YAML = 'setup.yaml'
@@ -124,7 +125,7 @@ def get_description():
     print(yellow("get description..."))
     check_setup_yaml_exists()
     with open(FILENAME_SETUP_YAML) as f:
-        data = yaml.load(f)
+        data = yaml_load(f)
     if not 'description' in data:
         abort("Package 'description' not found in 'setup.yaml'")
     return data['description']
@@ -139,7 +140,7 @@ def get_scm_config():
 def get_name():
     check_setup_yaml_exists()
     with open(FILENAME_SETUP_YAML) as f:
-        data = yaml.load(f)
+        data = yaml_load(f)
     if not 'name' in data:
         abort("Package 'name' not found in 'setup.yaml'")
     return data['name']
@@ -203,7 +204,7 @@ def get_next_version(current_version):
 def get_version(testing):
     check_setup_yaml_exists()
     with open(FILENAME_SETUP_YAML) as f:
-        data = yaml.load(f)
+        data = yaml_load(f)
     current_version = data['version']
     next_version = get_next_version(current_version)
     version = prompt(
@@ -1,8 +1,11 @@
 # -*- encoding: utf-8 -*-
 import glob
+import multiprocessing
+import multiprocessing.pool
 import os
+import re
 import shutil
-import tempfile
+import subprocess
 
 from datetime import datetime
 from walkdir import (
@@ -22,22 +25,179 @@ from fabric.colors import (
 )
 from fabric.context_managers import shell_env
 
+from lib.collection import (
+    BackupCatalog,
+    CatalogCache,
+    format_time,
+    parse_collection_status,
+)
+from lib.error import TaskError
+from lib.metrics import (
+    format_bytes,
+    Phases,
+    read_metrics,
+    summary,
+)
 from lib.path import Path
 from lib.postgres import (
     drop_local_database,
+    dump_format,
+    fast_load_options,
+    local_analyze,
+    local_load_file,
+    local_pool,
+    local_database_clone,
     local_database_create,
     local_database_exists,
-    local_load_file,
+    local_database_size,
+    local_load_stream,
+    local_owned_relations,
+    local_reassign_batches,
     local_reassign_owner,
+    local_restore_file,
+    local_restore_section,
+    local_row_count,
     local_user_create,
     local_user_exists,
+    reassign_batches,
+    REASSIGN_PARALLEL_MIN,
+)
+from lib.template import (
+    dump_hash,
+    template_name,
+    TemplateRegistry,
+)
+from lib.workspace import (
+    move,
+    workspace_root,
+    WORKSPACE_KEEP,
+    Workspaces,
+)
+
+
+# 'duplicity list-current-files' e.g. 'Sat Jan 24 01:00:04 2015 20150124_0100.sql'
+FILE_LIST = re.compile(
+    r'^\w{3} \w{3} [ \d]\d \d\d:\d\d:\d\d \d{4} (?P<path>.+)$'
 )
+# a database backup e.g. '20150124_0100.sql' or '20150124_0100.sql.gz'
+SQL_FILE = re.compile(r'^(?P<date>\d{8}_\d{4})\.(sql|dump)(\.gz)?$')
+
+
+def newest_sql(file_names):
+    """The most recent database backup in a list of file names (or 'None')."""
+    result = None
+    for file_name in file_names:
+        match = SQL_FILE.match(os.path.basename(file_name))
+        if match:
+            if not result or match.group('date') > result[0]:
+                result = (match.group('date'), file_name)
+    return result[1] if result else None
+
+
+def _catalog(args):
+    site_info, backup_or_files, refresh = args
+    try:
+        duplicity = Duplicity(site_info, backup_or_files)
+        return (site_info.domain, duplicity.catalog(refresh), None)
+    except (subprocess.CalledProcessError, TaskError) as e:
+        message = getattr(e, 'value', None) or str(e)
+        return (site_info.domain, None, message)
+
+
+def catalogs(site_infos, backup_or_files, processes=8, refresh=False):
+    """The 'BackupCatalog' for each site (the sites are checked in parallel).
+
+    Returns a list of '(domain, catalog, error)'.
+
+    """
+    pool = multiprocessing.pool.ThreadPool(processes)
+    try:
+        return pool.map(
+            _catalog,
+            [(site_info, backup_or_files, refresh) for site_info in site_infos],
+        )
+    finally:
+        pool.close()
+        pool.join()
+
+
+def filter_files(file_names, path):
+    """The files which are in 'path' (or are 'path')."""
+    prefix = path.rstrip('/') + '/'
+    return [
+        file_name for file_name in file_names
+        if file_name == path.rstrip('/') or file_name.startswith(prefix)
+    ]
+
+
+def load_seconds(tasks, name, site):
+    """The time taken to load the database the last time the site was
+    restored without the 'fast' option (or 'None' if it never was).
+
+    """
+    result = None
+    for task in tasks:
+        if task.get('task') != name or task.get('site') != site:
+            continue
+        if task.get('error'):
+            continue
+        records = [
+            record for record in task['phases']
+            if record['phase'].startswith('load')
+        ]
+        if records and not any(record.get('fast') for record in records):
+            result = sum(record['seconds'] for record in records)
+    return result
+
+
+def parse_file_list(out):
+    """The paths from the output of 'duplicity list-current-files'."""
+    result = []
+    for line in out.splitlines():
+        match = FILE_LIST.match(line.strip())
+        if match and match.group('path') != '.':
+            result.append(match.group('path'))
+    return result
+
+
+def _size(file_or_folder):
+    """The size (in bytes) of a file or all the files in a folder."""
+    if os.path.isdir(file_or_folder):
+        return sum(
+            os.path.getsize(file_name)
+            for file_name in file_paths(filtered_walk(file_or_folder))
+        )
+    return os.path.getsize(file_or_folder)
 
 
 class Duplicity(object):
 
-    def __init__(self, site_info, backup_or_files):
+    def __init__(
+            self, site_info, backup_or_files, jobs=None, stream=False,
+            template=False, fast=False, path_filter=None, time=None,
+            keep=WORKSPACE_KEEP, backup_set=None):
+        """Restore (or list) a duplicity backup.
+
+        'jobs' is the number of 'pg_restore' workers (defaults to the number
+        of CPUs).  If 'stream' is set, the SQL is loaded into the database
+        while it is being restored (see '_restore_database_stream').  If
+        'template' is set, the test database is cloned from a template
+        database for the dump (see 'lib.template').  If 'fast' is set, the
+        dump is loaded using 'FAST_LOAD_SETTINGS' (see '_load_database_fast').
+
+        'path_filter' is a file or folder in the 'files' backup
+        e.g. 'public/booking' (only this is downloaded and moved to the
+        project).  'time' is passed to the duplicity '--time' option
+        e.g. '2015-01-24' or '3D' (to restore the backup from that time).
+        'backup_set' is the number of a set from 'list_current' (or '-1'
+        for the newest) and is used instead of 'time'.
+        'keep' is the number of restore workspaces to keep for debugging
+        (see 'lib.workspace').
+
+        """
         self.backup = False
+        self.backup_set = backup_set
+        self.fast = fast
         self.files = False
         if backup_or_files == 'backup':
             self.backup = True
@@ -58,23 +218,38 @@ class Duplicity(object):
                 "Only 'backup' and 'files' are valid operations for duplicity "
                 "commands (not '{}')".format(backup_or_files)
             )
+        if self.backup and site_info.is_mysql and (stream or template):
+            abort(
+                "The 'stream' and 'template' options are for 'postgres' "
+                "databases (not 'mysql').  Restore without them."
+            )
+        if stream and template:
+            abort(
+                "Cannot use the 'stream' and 'template' options together "
+                "(a streamed restore does not create a template)."
+            )
         self.backup_or_files = backup_or_files
+        self.jobs = int(jobs) if jobs else multiprocessing.cpu_count()
+        self.keep = int(keep)
         self.path = Path(site_info.domain, file_type)
+        self.path_filter = path_filter.strip('/') if path_filter else None
+        self.phases = Phases(
+            'restore {}'.format(backup_or_files), site_info.domain
+        )
         self.site_info = site_info
+        self.stream = stream
+        self.template = template
+        self.time = time
 
-    def _display_backup_not_restored(self, restore_to, sql_file):
+    def _display_backup_skipped(self, older):
         print
         count = 0
-        files = file_paths(filtered_walk(restore_to))
-        for item in files:
-            if sql_file == item:
-                pass
-            else:
-                count = count + 1
-                print('{}. {}'.format(count, item))
+        for item in older:
+            count = count + 1
+            print('{}. {}'.format(count, item))
         if count:
             print(yellow(
-                "The {} files listed above were not restored "
+                "The {} older backups listed above were not downloaded "
                 "(just so you know).".format(count)
             ))
             print
@@ -96,7 +271,9 @@ class Duplicity(object):
     def _find_sql(self, restore_to):
         result = None
         found = None
+        # 'pg_dump' custom format files might be named '.dump'
         match = glob.glob('{}/*.sql'.format(restore_to))
+        match = match + glob.glob('{}/*.dump'.format(restore_to))
         for item in match:
             print('found: {}'.format(os.path.basename(item)))
             file_name, extension = os.path.splitext(os.path.basename(item))
@@ -110,6 +287,63 @@ class Duplicity(object):
             abort("Cannot find any SQL files to restore.")
         return result
 
+    def _find_newest_sql(self):
+        """Find the newest database backup without downloading anything.
+
+        Returns the name of the backup and a list of the older backups.
+
+        """
+        file_names = self._list_files()
+        sql_name = newest_sql(file_names)
+        if not sql_name:
+            abort("Cannot find any SQL files to restore.")
+        older = sorted(
+            name for name in file_names
+            if name != sql_name and SQL_FILE.match(os.path.basename(name))
+        )
+        return sql_name, older
+
+    def _create_database(self, database_name):
+        with self.phases.phase('create'):
+            if local_database_exists(database_name):
+                drop_local_database(database_name)
+            local_database_create(database_name)
+            if not local_user_exists(self.site_info):
+                local_user_create(self.site_info)
+        return database_name
+
+    def _create_test_database(self):
+        return self._create_database(self.path.test_database_name())
+
+    def _collection_status(self):
+        """The output from 'duplicity collection-status'.
+
+        'subprocess' (rather than the fabric 'local' and 'shell_env') so
+        we can run it for several sites at the same time.
+
+        """
+        env = dict(os.environ)
+        env.update(self._env())
+        return subprocess.check_output(
+            'duplicity collection-status {}'.format(self._repo()),
+            env=env,
+            shell=True,
+            universal_newlines=True,
+        )
+
+    def _estimate_size(self):
+        """The size of the last restore for this site (or 0 if none)."""
+        result = 0
+        for site in summary(read_metrics(), self.phases.name):
+            if site['site'] == self.site_info.domain:
+                result = site.get('bytes', 0)
+        return result
+
+    def _env(self):
+        return {
+            'PASSPHRASE': self.site_info.rsync_gpg_password,
+        }
+
     def _heading(self, command):
         print(yellow("{}: {} for {}").format(
             command,
@@ -124,15 +358,145 @@ class Duplicity(object):
             self.backup_or_files,
         )
 
-    def _restore(self, restore_to):
-        env = {
-            'PASSPHRASE': self.site_info.rsync_gpg_password,
-        }
-        with shell_env(**env):
-            local('duplicity restore {} {}'.format(
+    def _list_files(self):
+        """The files in the most recent backup (or the backup at 'time')."""
+        with shell_env(**self._env()):
+            out = local(
+                'duplicity list-current-files{} {}'.format(
+                    self._options(), self._repo()
+                ),
+                capture=True,
+            )
+        return parse_file_list(out)
+
+    def _options(self):
+        result = ''
+        if self.time:
+            result = ' --time {}'.format(self.time)
+        return result
+
+    def _display_database(self, database_name):
+        print(green("psql {}").format(database_name))
+        print("postgres: {connections} connection(s) for {statements} "
+              "statement(s)".format(**local_pool.stats()))
+
+    def _load_database(self, database_name, sql_file):
+        if self.fast:
+            self._load_database_fast(database_name, sql_file)
+            return
+        with self.phases.phase('load') as record:
+            file_format = local_restore_file(
+                database_name, sql_file, self.jobs
+            )
+            record['bytes'] = _size(sql_file)
+            record['rows'] = local_row_count(database_name)
+        print(green("restored '{}' format dump").format(file_format))
+        self._reassign_owner(database_name)
+
+    def _load_database_fast(self, database_name, sql_file):
+        """Load the dump with the settings for a bulk load.
+
+        A 'custom' or 'directory' format dump is restored a section at a
+        time, so the data is loaded before the indexes and constraints are
+        created (a 'plain' dump from 'pg_dump' is already in this order).
+        The statistics are collected at the end ('ANALYZE').
+
+        """
+        previous = load_seconds(
+            read_metrics(), self.phases.name, self.site_info.domain
+        )
+        file_format = dump_format(sql_file)
+        with shell_env(PGOPTIONS=fast_load_options()):
+            if file_format == 'plain':
+                with self.phases.phase('load') as record:
+                    record['fast'] = True
+                    local_load_file(database_name, sql_file)
+                    record['bytes'] = _size(sql_file)
+            else:
+                for section in ('pre-data', 'data', 'post-data'):
+                    name = 'load {}'.format(section)
+                    with self.phases.phase(name) as record:
+                        record['fast'] = True
+                        local_restore_section(
+                            database_name, sql_file, section, self.jobs
+                        )
+                        if section == 'data':
+                            record['bytes'] = _size(sql_file)
+        with self.phases.phase('load analyze') as record:
+            record['fast'] = True
+            local_analyze(database_name)
+            record['rows'] = local_row_count(database_name)
+        print(green(
+            "restored '{}' format dump (fast load in {:.1f} seconds)".format(
+                file_format, self.phases.seconds('load')
+            )
+        ))
+        if previous is None:
+            print(yellow(
+                "no restore without the 'fast' option to compare with"
+            ))
+        else:
+            print(green(
+                "the last load without the 'fast' option took {:.1f} "
+                "seconds".format(previous)
+            ))
+        self._reassign_owner(database_name)
+
+    def _reassign_owner(self, database_name):
+        """Change the owner of the restored objects to the local user.
+
+        For a large database, the tables, views and sequences are changed
+        by 'jobs' connections in parallel.  'REASSIGN OWNED' then changes
+        anything else (e.g. functions, types and the schemas).
+
+        """
+        from_user_name = self.site_info.db_name
+        to_user_name = self.path.user_name()
+        with self.phases.phase('reassign list') as record:
+            relations = local_owned_relations(database_name, from_user_name)
+            count = sum(len(items) for items in relations.values())
+            record['rows'] = count
+        if self.jobs > 1 and count >= REASSIGN_PARALLEL_MIN:
+            with self.phases.phase('reassign relations') as record:
+                record['rows'] = local_reassign_batches(
+                    database_name,
+                    reassign_batches(relations, to_user_name),
+                    self.jobs,
+                )
+        with self.phases.phase('reassign owner'):
+            local_reassign_owner(database_name, from_user_name, to_user_name)
+
+    def _restore(self, restore_to, file_to_restore=None):
+        """Restore the collection (or just one file or folder from it)."""
+        if file_to_restore:
+            target = os.path.join(restore_to, file_to_restore)
+            if not os.path.exists(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            command = 'duplicity restore{} --file-to-restore {} {} {}'.format(
+                self._options(),
+                file_to_restore,
+                self._repo(),
+                target,
+            )
+        else:
+            command = 'duplicity restore{} {} {}'.format(
+                self._options(),
                 self._repo(),
                 restore_to,
-            ))
+            )
+        with shell_env(**self._env()), self.phases.phase('download') as record:
+            local(command)
+            record['bytes'] = _size(restore_to)
+
+    def _restore_newest_sql(self, restore_to):
+        """Download the newest database backup (and nothing else)."""
+        sql_name, older = self._find_newest_sql()
+        print(green("download: {}".format(sql_name)))
+        self._restore(restore_to, sql_name)
+        if sql_name.endswith('.gz'):
+            with self.phases.phase('decompress'):
+                local('gunzip {}'.format(os.path.join(restore_to, sql_name)))
+        return older
 
     def _restore_database(self, restore_to):
         sql_file = self._find_sql(restore_to)
@@ -154,23 +518,106 @@ class Duplicity(object):
         from_to.append((sql_file, to_sql_file))
         self._remove_files_folders(from_to)
         # move the files/folders to the project folder
-        for from_file, to_file in from_to:
-            shutil.move(from_file, to_file)
+        self._move(from_to)
 
     def _restore_database_postgres(self, restore_to, sql_file):
+        if self.template:
+            self._restore_database_template(sql_file)
+        else:
+            database_name = self._create_test_database()
+            self._load_database(database_name, sql_file)
+            self._display_database(database_name)
+
+    def _restore_database_template(self, sql_file):
+        """Clone the test database from the template for this dump.
+
+        The template is created (and the dump loaded into it) if we haven't
+        restored this dump before.  The least recently used templates are
+        dropped if they use more than the disk budget.
+
+        """
+        registry = TemplateRegistry()
+        digest = dump_hash(sql_file)
+        template = template_name(digest)
+        if template in registry and local_database_exists(template):
+            print(green("template database: {}".format(template)))
+        else:
+            print(green("create template database: {}".format(template)))
+            self._create_database(template)
+            self._load_database(template, sql_file)
+            registry.add(
+                template,
+                digest,
+                local_database_size(template),
+                self.site_info.domain,
+            )
         database_name = self.path.test_database_name()
-        if local_database_exists(database_name):
-            drop_local_database(database_name)
-        local_database_create(database_name)
-        if not local_user_exists(self.site_info):
-            local_user_create(self.site_info)
-        local_load_file(database_name, sql_file)
-        local_reassign_owner(
-            database_name,
-            self.site_info.db_name,
-            self.path.user_name()
+        with self.phases.phase('clone'):
+            if local_database_exists(database_name):
+                drop_local_database(database_name)
+            local_database_clone(database_name, template)
+        registry.touch(template)
+        for name in registry.evict(keep=template):
+            print(yellow("drop template database: {}".format(name)))
+            if local_database_exists(name):
+                drop_local_database(name)
+        registry.save()
+        self._display_database(database_name)
+
+    def _restore_database_stream(self, restore_to):
+        """Load the SQL into the database while duplicity is restoring it.
+
+        duplicity cannot restore to a pipe, so we 'tail' the file while it is
+        being written (until the duplicity process finishes).  A compressed
+        file is decompressed in the pipe (not on the disk).
+
+        """
+        sql_name, older = self._find_newest_sql()
+        if not re.search(r'\.sql(\.gz)?$', sql_name):
+            abort(
+                "Cannot stream '{}' (only plain SQL).  Restore without the "
+                "'stream' option.".format(sql_name)
+            )
+        print(green("stream to test database: {}".format(sql_name)))
+        database_name = self._create_test_database()
+        sql_file = os.path.join(restore_to, sql_name)
+        status_file = os.path.join(restore_to, 'duplicity.status')
+        command = (
+            "(duplicity restore{options} --file-to-restore {name} {repo} "
+            "{file}; "
+            "echo $? > {status}) & "
+            "tail -c +1 --follow=name --retry --pid=$! {file} 2>/dev/null"
+        ).format(
+            name=sql_name,
+            options=self._options(),
+            repo=self._repo(),
+            file=sql_file,
+            status=status_file,
         )
-        print(green("psql {}").format(database_name))
+        if sql_name.endswith('.gz'):
+            command = command + ' | gunzip -c'
+        env = self._env()
+        if self.fast:
+            env['PGOPTIONS'] = fast_load_options()
+        with shell_env(**env):
+            with self.phases.phase('download and load') as record:
+                local_load_stream(database_name, command)
+                record['bytes'] = _size(sql_file)
+                record['rows'] = local_row_count(database_name)
+        if self.fast:
+            with self.phases.phase('analyze'):
+                local_analyze(database_name)
+        with open(status_file) as f:
+            status = f.read().strip()
+        if status != '0':
+            abort(
+                "duplicity failed (exit status {}), so the '{}' database "
+                "is not complete".format(status, database_name)
+            )
+        self._reassign_owner(database_name)
+        self._display_database(database_name)
+        self._display_backup_skipped(older)
+        return sql_file
 
     def _remove_file_or_folder(self, file_name):
         if os.path.exists(file_name):
@@ -216,6 +663,48 @@ class Duplicity(object):
         result.sort() # required for the test
         return result
 
+    def _get_path_from_to(self, restore_to, project_folder, path):
+        """Move a single file or folder (see 'path_filter')."""
+        return [
+            (os.path.join(restore_to, path), os.path.join(project_folder, path))
+        ]
+
+    def _display_path_filter(self, restore_to, file_names):
+        """How much we didn't download (because of the 'path_filter')."""
+        count = len(filter_files(file_names, self.path_filter))
+        print(green(
+            "'{}': downloaded {} of {} files ({}).  {} files were filtered "
+            "out.".format(
+                self.path_filter,
+                count,
+                len(file_names),
+                format_bytes(_size(restore_to)),
+                len(file_names) - count,
+            )
+        ))
+
+    def _move(self, from_to):
+        """Move the restored files to the project (see 'lib.workspace.move').
+
+        The workspace is usually on the same file system as the project, so
+        the files are renamed.  If not, they are copied in parallel.
+
+        """
+        with self.phases.phase('move') as record:
+            result = move(from_to, self.jobs)
+            if result['copied']:
+                record['bytes'] = result['bytes']
+        if result['copied']:
+            print(yellow(
+                "copied {} files/folders ({}) to a different file "
+                "system".format(result['copied'], format_bytes(result['bytes']))
+            ))
+
+    def _project_folder(self):
+        if self.site_info.is_php or self.backup:
+            return self.path.local_project_folder(self.site_info.domain)
+        return self.path.local_project_folder(self.site_info.package)
+
     def _restore_files(self, restore_to):
         if self.site_info.is_php:
             self._restore_files_php_site(restore_to)
@@ -223,48 +712,123 @@ class Duplicity(object):
             self._restore_files_django_site(restore_to)
 
     def _restore_files_django_site(self, restore_to):
-        from_to = self._get_from_to(
-            os.path.join(restore_to, 'public'),
-            self.path.local_project_folder_media(self.site_info.package),
-        )
-        from_to = from_to + self._get_from_to(
-            os.path.join(restore_to, 'private'),
-            self.path.local_project_folder_media_private(self.site_info.package),
-        )
+        folders = {
+            'public': self.path.local_project_folder_media(
+                self.site_info.package
+            ),
+            'private': self.path.local_project_folder_media_private(
+                self.site_info.package
+            ),
+        }
+        if self.path_filter:
+            top, ignore, path = self.path_filter.partition('/')
+            if top not in folders:
+                abort(
+                    "The path filter for a Django site must start with "
+                    "'public' or 'private' (not '{}')".format(self.path_filter)
+                )
+            names = [top]
+        else:
+            path = None
+            names = ['public', 'private']
+        from_to = []
+        for name in names:
+            if path:
+                from_to = from_to + self._get_path_from_to(
+                    os.path.join(restore_to, name), folders[name], path
+                )
+            else:
+                from_to = from_to + self._get_from_to(
+                    os.path.join(restore_to, name), folders[name]
+                )
         self._remove_files_folders(from_to)
         # move the files/folders to the project folder
-        for from_file, to_file in from_to:
-            shutil.move(from_file, to_file)
+        self._move(from_to)
 
     def _restore_files_php_site(self, restore_to):
-        from_to = self._get_from_to(
-            restore_to,
-            self.path.local_project_folder(self.site_info.domain),
-        )
+        project_folder = self.path.local_project_folder(self.site_info.domain)
+        if self.path_filter:
+            from_to = self._get_path_from_to(
+                restore_to, project_folder, self.path_filter
+            )
+        else:
+            from_to = self._get_from_to(restore_to, project_folder)
         self._remove_files_folders(from_to)
         # move the files/folders to the project folder
-        for from_file, to_file in from_to:
-            shutil.move(from_file, to_file)
+        self._move(from_to)
 
-    def list_current(self):
+    def catalog(self, refresh=False):
+        """The 'BackupCatalog' for the collection (cached for a while)."""
+        cache = CatalogCache()
+        result = None
+        if not refresh:
+            result = cache.get(self.site_info.domain, self.backup_or_files)
+        if result is None:
+            result = BackupCatalog(
+                parse_collection_status(self._collection_status())
+            )
+            cache.put(self.site_info.domain, self.backup_or_files, result)
+        return result
+
+    def list_current(self, refresh=False):
         self._heading('list_current')
-        local('duplicity collection-status {}'.format(self._repo()))
+        catalog = self.catalog(refresh)
+        for line in catalog.lines():
+            print(line)
+        print(green("{} chain(s), {} full backup(s), {} volume(s)".format(
+            len(catalog.chains), len(catalog.full_sets()), catalog.volumes()
+        )))
+        print(yellow("catalog from {} (use 'refresh' to update)".format(
+            format_time(catalog.created)
+        )))
 
     def restore(self):
         self._heading('restore')
+        if self.backup_set is not None:
+            try:
+                backup_set = self.catalog().find(self.backup_set)
+            except TaskError as e:
+                abort(e.value)
+            self.time = str(backup_set['time'])
+            print(green("backup set: {} ({})".format(
+                format_time(backup_set['time']), backup_set['type']
+            )))
+        error = None
+        workspaces = Workspaces(
+            root=workspace_root(near=self._project_folder()),
+            keep=self.keep,
+        )
+        restore_to = workspaces.create(
+            '{}-{}'.format(self.site_info.domain, self.backup_or_files),
+            self._estimate_size(),
+        )
         try:
-            restore_to = tempfile.mkdtemp()
-            self._restore(restore_to)
-            if self.backup:
-                sql_file = self._restore_database(restore_to)
-                self._display_backup_not_restored(restore_to, sql_file)
+            if self.backup and self.stream:
+                self._restore_database_stream(restore_to)
+            elif self.backup:
+                older = self._restore_newest_sql(restore_to)
+                self._restore_database(restore_to)
+                self._display_backup_skipped(older)
+            elif self.files and self.path_filter:
+                file_names = self._list_files()
+                self._restore(restore_to, self.path_filter)
+                self._display_path_filter(restore_to, file_names)
+                self._restore_files(restore_to)
+                self._display_files_not_restored(restore_to)
             elif self.files:
+                self._restore(restore_to)
                 self._restore_files(restore_to)
                 self._display_files_not_restored(restore_to)
             else:
                 abort("Nothing to do... (this is a problem)")
+        except BaseException as e:
+            # 'abort' raises 'SystemExit'
+            error = repr(e)
+            raise
         finally:
-            if os.path.exists(restore_to):
-                #shutil.rmtree(restore_to)
-                pass
+            for folder in workspaces.release(restore_to):
+                print(yellow("removed workspace: {}".format(folder)))
+            self.phases.write(error=error)
+        for line in self.phases.lines():
+            print(cyan(line))
         self._heading('Complete')
@@ -1,5 +1,7 @@
+import errno
 import getpass
 import os
+import tempfile
 
 from datetime import datetime
 
@@ -11,6 +13,44 @@ SSL_CERT_NAME = 'ssl-unified.crt'
 SSL_SERVER_KEY = 'server.key'
 
 
+def get_cache_folder(*names):
+    """A folder for data we keep between fab commands e.g. the pillar.
+
+    The folder (and any sub-folders in 'names') are created if they do not
+    exist.
+
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache'
+    )
+    result = os.path.join(cache_home, 'pkimber-fabric', *names)
+    if not os.path.exists(result):
+        try:
+            os.makedirs(result)
+        except OSError as e:
+            # another thread (or fab command) created it first
+            if e.errno != errno.EEXIST:
+                raise
+    return result
+
+
+def write_atomic(file_name, write, mode='w'):
+    """Call 'write' with a temporary file and then rename it to 'file_name'.
+
+    The temporary file is in the same folder, so the rename is atomic and a
+    reader never sees half a file.
+
+    """
+    handle, temp_name = tempfile.mkstemp(dir=os.path.dirname(file_name))
+    try:
+        with os.fdopen(handle, mode) as f:
+            write(f)
+        os.rename(temp_name, file_name)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+
 def get_pillar_folder(pillar_folder=None):
     """Find the pillar folder on your local workstation."""
     if pillar_folder == None:
@@ -0,0 +1,152 @@
+"""Time the phases of a long running task (e.g. a database restore).
+
+The phases for each task are written to a metrics file (one JSON document
+per line), so we can find the sites which take longest to restore (see
+'summary').
+
+"""
+import contextlib
+import json
+import os
+import time
+
+from lib.folder import get_cache_folder
+
+
+def format_bytes(count):
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            break
+        count = count / 1024.0
+    if unit == 'bytes':
+        return '{} {}'.format(int(count), unit)
+    return '{:.1f} {}'.format(count, unit)
+
+
+def metrics_file_name():
+    return os.path.join(get_cache_folder(), 'metrics.jsonl')
+
+
+def read_metrics(file_name=None):
+    """The tasks from the metrics file (oldest first)."""
+    result = []
+    file_name = file_name or metrics_file_name()
+    if os.path.exists(file_name):
+        with open(file_name) as f:
+            for line in f:
+                try:
+                    result.append(json.loads(line))
+                except ValueError:
+                    # a line may be incomplete if a task was interrupted
+                    pass
+    return result
+
+
+def summary(tasks, name='restore'):
+    """Rank the sites by the average time taken by a task (slowest first).
+
+    Returns a list of dicts with the 'site', the number of times the task
+    was run ('count') and the average and maximum 'seconds'.  'bytes' and
+    'rows' are from the most recent run.
+
+    """
+    sites = {}
+    for task in tasks:
+        if task.get('task') != name or task.get('error'):
+            continue
+        site = sites.setdefault(task.get('site'), dict(
+            count=0, max_seconds=0, site=task.get('site'), total=0,
+        ))
+        site['count'] = site['count'] + 1
+        site['total'] = site['total'] + task['seconds']
+        site['max_seconds'] = max(site['max_seconds'], task['seconds'])
+        for key in ('bytes', 'rows'):
+            values = [
+                record[key] for record in task['phases'] if key in record
+            ]
+            if values:
+                site[key] = max(values)
+    result = []
+    for site in sites.values():
+        site['seconds'] = site.pop('total') / site['count']
+        result.append(site)
+    result.sort(key=lambda site: site['seconds'], reverse=True)
+    return result
+
+
+class Phases(object):
+    """The time taken by each phase of a task.
+
+    e.g::
+
+      phases = Phases('restore')
+      with phases.phase('load') as record:
+          load()
+          record['rows'] = 1234
+
+    The caller can add 'rows' and 'bytes' to the record for the phase.
+
+    """
+
+    def __init__(self, name, site=None):
+        self.name = name
+        self.records = []
+        self.site = site
+        self.started = time.time()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        record = dict(phase=name)
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.time() - start
+            self.records.append(record)
+
+    def lines(self):
+        """A line of text for each phase (for the report)."""
+        result = []
+        for record in self.records:
+            seconds = record['seconds']
+            line = '{}: {:.1f} seconds'.format(record['phase'], seconds)
+            rows = record.get('rows')
+            if rows is not None:
+                line = line + ', {:,} rows'.format(rows)
+                if seconds:
+                    line = line + ' ({:,.0f} rows/second)'.format(
+                        rows / seconds
+                    )
+            count = record.get('bytes')
+            if count is not None:
+                line = line + ', {}'.format(format_bytes(count))
+                if seconds:
+                    line = line + ' ({}/second)'.format(
+                        format_bytes(count / seconds)
+                    )
+            result.append(line)
+        return result
+
+    def as_dict(self):
+        return dict(
+            phases=self.records,
+            seconds=self.seconds(),
+            site=self.site,
+            started=self.started,
+            task=self.name,
+        )
+
+    def write(self, file_name=None, error=None):
+        """Add the task to the end of the metrics file."""
+        data = self.as_dict()
+        if error:
+            data['error'] = error
+        with open(file_name or metrics_file_name(), 'a') as f:
+            f.write(json.dumps(data, sort_keys=True) + '\n')
+
+    def seconds(self, prefix=None):
+        """The total time (for the phases starting with 'prefix')."""
+        return sum(
+            record['seconds'] for record in self.records
+            if prefix is None or record['phase'].startswith(prefix)
+        )
@@ -0,0 +1,435 @@
+"""Read the salt pillar files from the local workstation.
+
+A single fab invocation creates several 'SiteInfo' objects and every one of
+them reads 'top.sls' and the 'sls' files it references.  The documents are
+parsed once and shared through a process wide cache.
+
+The cache can be saved to a snapshot file between fab commands (see
+'use_snapshot'), so a new process only parses the files which have changed.
+
+Note: the cached documents are shared, so treat them as read-only.
+
+'top.sls' is parsed into an 'OrderedDict', because salt applies the targets
+in the order they are written (a plain 'dict' has no order on Python 2).
+
+"""
+import atexit
+import collections
+import fnmatch
+import hashlib
+import os
+import re
+import yaml
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from lib.error import TaskError
+from lib.folder import (
+    get_cache_folder,
+    write_atomic,
+)
+from lib.yaml_loader import yaml_load
+
+
+class PillarCache(object):
+    """Parsed pillar documents keyed on the absolute path of the file.
+
+    An entry is only returned if the modification time and size of the file
+    have not changed since it was parsed.  The least recently used entries are
+    discarded when the cache holds more than 'max_size' documents.
+
+    """
+
+    SNAPSHOT_VERSION = 2
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._changed = False
+        self._data = collections.OrderedDict()
+        self._derived = {}
+
+    def __contains__(self, file_name):
+        return os.path.abspath(file_name) in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def _parse(self, file_name):
+        ordered = os.path.basename(file_name) == 'top.sls'
+        with open(file_name, 'r') as f:
+            return yaml_load(f, ordered=ordered)
+
+    def _signature(self, file_name):
+        stat = os.stat(file_name)
+        return (stat.st_mtime, stat.st_size)
+
+    def _trim(self):
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self._derived.clear()
+        self.hits = 0
+        self.misses = 0
+        self._changed = False
+
+    def invalidate(self, file_name=None):
+        """Remove a file from the cache (or everything if no file name)."""
+        if file_name is None:
+            self._data.clear()
+            self._derived.clear()
+        else:
+            key = os.path.abspath(file_name)
+            self._data.pop(key, None)
+            for derived_key in list(self._derived.keys()):
+                if derived_key[0] == key:
+                    del self._derived[derived_key]
+
+    def derived(self, file_name, build):
+        """Return 'build(document)' for the parsed document.
+
+        The result is cached until the document is parsed again.
+
+        """
+        document = self.load(file_name)
+        key = (os.path.abspath(file_name), build)
+        entry = self._derived.get(key)
+        if entry is None or entry[0] is not document:
+            entry = (document, build(document))
+            self._derived[key] = entry
+        return entry[1]
+
+    def load(self, file_name):
+        """Return the parsed document for 'file_name'."""
+        key = os.path.abspath(file_name)
+        signature = self._signature(key)
+        entry = self._data.pop(key, None)
+        if entry and entry[0] == signature:
+            self.hits = self.hits + 1
+            document = entry[1]
+        else:
+            self.misses = self.misses + 1
+            self._changed = True
+            document = self._parse(key)
+        # most recently used at the end
+        self._data[key] = (signature, document)
+        self._trim()
+        return document
+
+    def load_snapshot(self, file_name):
+        """Add the documents from a snapshot file to the cache.
+
+        The entries are checked against the files on disk when they are
+        used, so an out of date snapshot just means the changed files are
+        parsed again.  Returns the number of documents read.
+
+        """
+        try:
+            with open(file_name, 'rb') as f:
+                data = pickle.load(f)
+        except (IOError, OSError):
+            return 0
+        except Exception:
+            # a snapshot we cannot read will be replaced
+            self._changed = True
+            return 0
+        if data.get('version') != self.SNAPSHOT_VERSION:
+            self._changed = True
+            return 0
+        count = 0
+        for key, entry in data['documents']:
+            if key not in self._data:
+                self._data[key] = entry
+                count = count + 1
+        self._trim()
+        return count
+
+    def save_snapshot(self, file_name, folder=None):
+        """Write the cache to a snapshot file (if anything has changed).
+
+        If 'folder' is set, only the documents for files in the folder are
+        saved.
+
+        """
+        if not self._changed:
+            return False
+        prefix = None
+        if folder:
+            prefix = os.path.join(os.path.abspath(folder), '')
+        documents = []
+        for key, entry in self._data.items():
+            if prefix and not key.startswith(prefix):
+                continue
+            if os.path.exists(key):
+                documents.append((key, entry))
+        data = dict(version=self.SNAPSHOT_VERSION, documents=documents)
+        write_atomic(
+            file_name,
+            lambda f: pickle.dump(data, f, pickle.HIGHEST_PROTOCOL),
+            mode='wb',
+        )
+        self._changed = False
+        return True
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, size=len(self._data))
+
+
+pillar_cache = PillarCache()
+_snapshots = set()
+
+
+def load_sls(file_name):
+    """Parse a pillar file using the process wide cache."""
+    return pillar_cache.load(file_name)
+
+
+def snapshot_file_name(pillar_folder):
+    """Each pillar folder has its own snapshot in the cache folder."""
+    key = hashlib.sha1(
+        os.path.abspath(pillar_folder).encode('utf-8')
+    ).hexdigest()
+    return os.path.join(
+        get_cache_folder('pillar'),
+        '{}.pickle'.format(key[:16]),
+    )
+
+
+def use_snapshot(pillar_folder):
+    """Start with the pillar documents parsed by the previous fab command.
+
+    The snapshot is updated when the process exits.
+
+    """
+    file_name = snapshot_file_name(pillar_folder)
+    if file_name not in _snapshots:
+        _snapshots.add(file_name)
+        pillar_cache.load_snapshot(file_name)
+        atexit.register(pillar_cache.save_snapshot, file_name, pillar_folder)
+
+
+def load_sls_config(pillar_folder, config):
+    """Parse the config from the 'top.sls' file.
+
+    e.g::
+
+      - config.django
+      - config.nginx
+
+    """
+    names = config.split('.')
+    file_name = os.path.join(pillar_folder, *names)
+    file_name = file_name + '.sls'
+    attr = load_sls(file_name)
+    if len(attr) > 1:
+        raise TaskError(
+            "Unexpected state: 'sls' file contains more "
+            "than one key: {}".format(file_name)
+        )
+    return attr
+
+
+def load_top(pillar_folder):
+    """The 'base' environment from the 'top.sls' file."""
+    data = load_sls(os.path.join(pillar_folder, 'top.sls'))
+    return data.get('base')
+
+
+def minion_sls(pillar_folder, minion_id):
+    """The list of 'sls' config names for a minion (in 'top.sls' order)."""
+    return top_matcher(pillar_folder).sls(minion_id)
+
+
+def top_matcher(pillar_folder):
+    """The 'TopMatcher' for 'top.sls' (cached with the parsed file)."""
+    return pillar_cache.derived(
+        os.path.join(pillar_folder, 'top.sls'),
+        TopMatcher.from_top,
+    )
+
+
+class TopMatcher(object):
+    """The targets from 'top.sls' compiled, so we can match minions quickly.
+
+    The salt match types are supported e.g::
+
+      base:
+        'drop-*':
+          - config.django
+        'drop,drop-temp':
+          - match: list
+          - sites.kb
+        'drop-[0-9]+':
+          - match: pcre
+          - sites.pk
+
+    A glob target also matches any of the comma separated parts of the
+    target.  Other match types (e.g. 'grain') are treated as a glob.
+
+    """
+
+    WILDCARD = re.compile(r'[*?[]')
+
+    def __init__(self, base):
+        self._minion_ids = set()
+        self._targets = []
+        for target, items in base.items():
+            match_type = 'glob'
+            sls = []
+            for item in items:
+                if isinstance(item, dict):
+                    match_type = item.get('match', match_type)
+                else:
+                    sls.append(item)
+            self._targets.append((self._compile(target, match_type), sls))
+
+    @classmethod
+    def from_top(cls, data):
+        return cls(data.get('base'))
+
+    def _compile(self, target, match_type):
+        """Returns a function which tests a minion against the target."""
+        if match_type == 'list':
+            names = set(re.split(r'[\s,]+', target.strip()))
+            self._minion_ids.update(names)
+            return names.__contains__
+        elif match_type == 'pcre':
+            return re.compile(target).match
+        else:
+            patterns = [target] + target.split(',')
+            for name in target.split(','):
+                if not self.WILDCARD.search(name):
+                    self._minion_ids.add(name)
+            regexes = [
+                re.compile(fnmatch.translate(pattern))
+                for pattern in patterns
+            ]
+            return lambda minion_id: any(
+                regex.match(minion_id) for regex in regexes
+            )
+
+    def minion_ids(self):
+        """The minions named in 'top.sls' (not wildcards or expressions)."""
+        return sorted(self._minion_ids)
+
+    def sls(self, minion_id):
+        """The 'sls' config names for a minion (in 'top.sls' order)."""
+        result = []
+        for match, sls in self._targets:
+            if match(minion_id):
+                result = result + sls
+        return result
+
+
+def load_minion_pillar(pillar_folder, minion_id, sls=None):
+    """Merge the 'sls' files for a minion into a single dict."""
+    result = {}
+    if sls is None:
+        sls = minion_sls(pillar_folder, minion_id)
+    for name in sls:
+        attr = load_sls_config(pillar_folder, name)
+        # will contain no more than one key (see above)
+        for key in attr.keys():
+            if key in result:
+                raise TaskError(
+                    "key '{}' is already contained in "
+                    "'{}".format(key, minion_id)
+                )
+        result.update(attr)
+    return result
+
+
+class PillarIndex(object):
+    """Find the minion for a domain without building a 'SiteInfo' for each.
+
+    'top.sls' and each 'sls' file are read once.  The index maps each
+    domain to the minions which include it (wildcard targets are not
+    minions, so they are only used to find the 'sls' files).
+
+    A site is often added to the pillar for the live server and for a
+    testing server (with a 'testing' key).  The live and testing minions are
+    kept apart, so the domain is only ambiguous if it belongs to more than
+    one of either.
+
+    A minion whose pillar cannot be merged (e.g. the same key in two 'sls'
+    files, or an 'sls' file which is missing or cannot be parsed) is left
+    out of the index and the error is kept in 'errors'.
+
+    """
+
+    def __init__(self, pillar_folder):
+        self.pillar_folder = pillar_folder
+        self.errors = {}
+        self._domains = {}
+        self._pillar = {}
+        self._sls = {}
+        self._build()
+
+    def _build(self):
+        matcher = top_matcher(self.pillar_folder)
+        for minion_id in matcher.minion_ids():
+            sls = matcher.sls(minion_id)
+            self._sls[minion_id] = sls
+            try:
+                pillar = load_minion_pillar(self.pillar_folder, minion_id, sls)
+            except TaskError as e:
+                self.errors[minion_id] = e.value
+                continue
+            except (IOError, OSError, yaml.YAMLError) as e:
+                self.errors[minion_id] = str(e)
+                continue
+            self._pillar[minion_id] = pillar
+            for domain in pillar.get('sites') or {}:
+                self._domains.setdefault(domain, []).append(minion_id)
+
+    def domains(self):
+        return sorted(self._domains.keys())
+
+    def is_testing(self, minion_id):
+        return bool(self._pillar[minion_id].get('testing'))
+
+    def minion_id(self, domain, testing=False):
+        """Return the live (or testing) minion for a domain."""
+        minions = [
+            minion_id for minion_id in self.minions(domain)
+            if self.is_testing(minion_id) == bool(testing)
+        ]
+        if not minions:
+            message = "cannot find '{}' in pillar '{}'.".format(
+                domain, self.pillar_folder
+            )
+            if self.errors:
+                message = message + "  Cannot read the pillar for: {}".format(
+                    ', '.join(sorted(self.errors.keys()))
+                )
+            raise TaskError(message)
+        if len(minions) > 1:
+            raise TaskError(
+                "'{}' is ambiguous.  It is contained in the pillar for more "
+                "than one {}server: {}".format(
+                    domain,
+                    'testing ' if testing else '',
+                    ', '.join(minions),
+                )
+            )
+        return minions[0]
+
+    def minions(self, domain=None):
+        """The minions (for a domain if one is specified)."""
+        if domain is None:
+            result = sorted(self._pillar.keys())
+        else:
+            result = list(self._domains.get(domain, []))
+        return result
+
+    def pillar(self, minion_id):
+        return self._pillar[minion_id]
+
+    def sls(self, minion_id):
+        return list(self._sls[minion_id])
@@ -1,13 +1,120 @@
 # -*- encoding: utf-8 -*-
+import atexit
+import multiprocessing.pool
+import os
+import re
+
 from fabric.api import (
+    env,
     local,
     run,
 )
+from fabric.colors import yellow
 from fabric.context_managers import shell_env
 
 from lib.error import TaskError
 
 
+# session settings for loading a test database as quickly as possible.  We
+# don't care if the database is lost when the workstation crashes.
+FAST_LOAD_SETTINGS = (
+    ('maintenance_work_mem', '1GB'),
+    ('synchronous_commit', 'off'),
+)
+# the SQL for 'ALTER ... OWNER TO' for each kind of relation ('pg_class')
+OWNER_RELKIND = {
+    'f': 'FOREIGN TABLE',
+    'm': 'MATERIALIZED VIEW',
+    'p': 'TABLE',
+    'r': 'TABLE',
+    'S': 'SEQUENCE',
+    'v': 'VIEW',
+}
+# databases with fewer objects than this use a single 'REASSIGN OWNED'
+REASSIGN_PARALLEL_MIN = 1000
+
+
+class LocalConnectionPool(object):
+    """Connections to the local postgres server (one per database).
+
+    The connections are opened as the 'postgres' user with 'autocommit', so
+    we can run DDL e.g. 'CREATE DATABASE'.  A restore runs several
+    statements, so they share one connection (rather than connecting for
+    each statement).
+
+    """
+
+    def __init__(self, user_name='postgres'):
+        self.user_name = user_name
+        self.opened = 0
+        self.statements = 0
+        self._connections = {}
+
+    def close(self, database_name=None):
+        """Close the connection to a database (or all the connections).
+
+        We cannot drop a database (or use it as a template) while we have a
+        connection to it.
+
+        """
+        if database_name is None:
+            names = list(self._connections.keys())
+        else:
+            names = [database_name]
+        for name in names:
+            connection = self._connections.pop(name, None)
+            if connection and not connection.closed:
+                connection.close()
+
+    def connection(self, database_name=None):
+        import psycopg2
+        database_name = database_name or 'postgres'
+        connection = self._connections.get(database_name)
+        if connection is None or connection.closed:
+            connection = psycopg2.connect('dbname={} user={}'.format(
+                database_name, self.user_name
+            ))
+            connection.autocommit = True
+            self._connections[database_name] = connection
+            self.opened = self.opened + 1
+        return connection
+
+    def execute(self, sql, database_name=None):
+        """Run the SQL and return the first row of the result (if any)."""
+        cursor = self.connection(database_name).cursor()
+        try:
+            cursor.execute(sql)
+            self.statements = self.statements + 1
+            result = None
+            if cursor.description:
+                result = cursor.fetchone()
+        finally:
+            cursor.close()
+        return result
+
+    def query(self, sql, database_name=None):
+        """Run the SQL and return all the rows."""
+        cursor = self.connection(database_name).cursor()
+        try:
+            cursor.execute(sql)
+            self.statements = self.statements + 1
+            result = cursor.fetchall()
+        finally:
+            cursor.close()
+        return result
+
+    def stats(self):
+        return dict(
+            connections=self.opened,
+            open=len(self._connections),
+            statements=self.statements,
+        )
+
+
+local_pool = LocalConnectionPool()
+atexit.register(local_pool.close)
+
+
 def _db_host(site_info):
     result = ''
     if site_info.db_host:
@@ -59,6 +166,31 @@ def _sql_database_create(database_name, table_space):
     )
 
 
+def _sql_database_clone(database_name, template):
+    return "CREATE DATABASE {} TEMPLATE={};".format(database_name, template)
+
+
+def _sql_database_size(database_name):
+    return "SELECT pg_database_size('{}')".format(database_name)
+
+
+def _sql_catalog():
+    """The roles and the databases (with the owner and size) in one query.
+
+    We can only find the size of a database we can connect to.
+
+    """
+    return (
+        "SELECT 'role', rolname, '', '' FROM pg_roles "
+        "UNION ALL "
+        "SELECT 'database', d.datname, pg_get_userbyid(d.datdba), "
+        "CASE WHEN d.datallowconn "
+        "AND has_database_privilege(d.datname, 'CONNECT') "
+        "THEN pg_database_size(d.datname)::text ELSE '' END "
+        "FROM pg_database d"
+    )
+
+
 def _sql_database_exists(database_name):
     return "SELECT COUNT(*) FROM pg_database WHERE datname='{}'".format(
         database_name
@@ -73,14 +205,75 @@ def _sql_drop_database(database_name):
     return "DROP DATABASE {}".format(database_name)
 
 
-def _sql_drop_user(user_name):
-    return "DROP ROLE {}".format(user_name)
+def _sql_row_count():
+    """An estimate of the number of rows (from the statistics collector)."""
+    return (
+        "SELECT COALESCE(SUM(n_live_tup), 0) FROM pg_stat_user_tables"
+    )
+
+
+def _sql_alter_owner(schema, name, relkind, user_name):
+    return 'ALTER {} "{}"."{}" OWNER TO {}'.format(
+        OWNER_RELKIND[relkind],
+        schema.replace('"', '""'),
+        name.replace('"', '""'),
+        user_name,
+    )
+
+
+def _sql_owned_relations(user_name):
+    """The relations owned by the user (not indexes or owned sequences).
+
+    The owner of an index or of a sequence which belongs to a column is
+    changed with the table.
+
+    """
+    return (
+        "SELECT n.nspname, c.relname, c.relkind FROM pg_class c "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "JOIN pg_roles r ON r.oid = c.relowner "
+        "WHERE r.rolname = '{}' "
+        "AND c.relkind IN ({}) "
+        "AND n.nspname NOT IN ('pg_catalog', 'information_schema') "
+        "AND n.nspname NOT LIKE 'pg_toast%' "
+        "AND NOT EXISTS ("
+        "SELECT 1 FROM pg_depend d "
+        "WHERE d.classid = 'pg_class'::regclass AND d.objid = c.oid "
+        "AND d.deptype IN ('a', 'i') AND c.relkind = 'S') "
+        "ORDER BY n.nspname, c.relname".format(
+            user_name,
+            ', '.join("'{}'".format(kind) for kind in sorted(OWNER_RELKIND)),
+        )
+    )
 
 
 def _sql_reassign_owner(from_user_name, to_user_name):
     return "REASSIGN OWNED BY {} TO {}".format(from_user_name, to_user_name)
 
 
+def _sql_drop_database_if_exists(database_name):
+    return "DROP DATABASE IF EXISTS {}".format(database_name)
+
+
+def _sql_drop_user_if_exists(user_name):
+    return "DROP ROLE IF EXISTS {}".format(user_name)
+
+
+def _sql_user_create_if_not_exists(user_name, password):
+    """Create the role in the same session as the database.
+
+    'CREATE ROLE' has no 'IF NOT EXISTS', so use a 'DO' block.
+
+    """
+    return (
+        "DO $$BEGIN "
+        "IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = '{}') THEN "
+        "{}; "
+        "END IF; "
+        "END$$".format(user_name, _sql_user_create(user_name, password))
+    )
+
+
 def _sql_user_exists(user_name):
     return "SELECT COUNT(*) FROM pg_user WHERE usename = '{}'".format(
         user_name
@@ -88,46 +281,191 @@ def _sql_user_exists(user_name):
 
 
 def _run_local(sql, database_name=None):
-    database = ''
-    if database_name:
-        database = '-d {}'.format(database_name)
-    local('psql -X -U postgres {} -c "{}"'.format(database, sql))
+    return local_pool.execute(sql, database_name)
 
 
-def _run_local_psycopg2(sql):
-    import psycopg2
-    conn = psycopg2.connect('dbname={0} user={0}'.format('postgres'))
-    cursor = conn.cursor()
-    cursor.execute(sql)
-    return cursor.fetchone()
+class CatalogSnapshot(object):
+    """The roles and databases on a server (see '_sql_catalog').
 
+    'databases' maps the name of the database to a dict with the 'owner'
+    and 'size' (in bytes or 'None' if we cannot connect to it).
 
-def _run_remote(site_info, sql):
-    """Run a remote command as the 'postgres' user.
+    """
+
+    def __init__(self, out):
+        self.databases = {}
+        self.roles = set()
+        for line in out.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            kind, name, owner, size = line.split('|')
+            if kind == 'role':
+                self.roles.add(name)
+            elif kind == 'database':
+                self.databases[name] = dict(
+                    owner=owner,
+                    size=int(size) if size else None,
+                )
+
+    def database_exists(self, database_name):
+        return database_name in self.databases
+
+    def database_owner(self, database_name):
+        return self.databases[database_name]['owner']
+
+    def database_size(self, database_name):
+        return self.databases[database_name]['size']
+
+    def user_exists(self, user_name):
+        return user_name in self.roles
+
+
+class RemoteCatalog(object):
+    """A 'CatalogSnapshot' for each server we use during a fab command.
+
+    The snapshot is read (in one query) the first time we need it and is
+    thrown away when 'RemoteSql' runs a statement which might change the
+    catalog (e.g. 'CREATE DATABASE').
+
+    A workflow which changes the catalog should not read the snapshot just
+    to check it (that is an extra 'psql' session).  It can use the 'cached'
+    snapshot (if we have one) or add '_sql_catalog' to its own batch.
 
-    We need the 'postgres' user to create a role or database.
     """
-    pg_data = _pg_data_postgres(site_info)
-    with shell_env(**pg_data):
-        result = run('psql -X {} -U postgres -t -A -c "{}"'.format(
-            _db_host(site_info),
-            sql,
-        ))
-    return result
 
+    def __init__(self):
+        self.queries = 0
+        self._snapshots = {}
+
+    def _key(self, site_info):
+        return (env.host_string, site_info.db_host)
+
+    def cached(self, site_info):
+        """The snapshot (or 'None' if we haven't read it yet)."""
+        return self._snapshots.get(self._key(site_info))
+
+    def invalidate(self, site_info=None):
+        if site_info is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(self._key(site_info), None)
+
+    def snapshot(self, site_info):
+        key = self._key(site_info)
+        result = self._snapshots.get(key)
+        if result is None:
+            batch = RemoteSql(site_info)
+            batch.add(_sql_catalog())
+            result = CatalogSnapshot(batch.run()[0])
+            self.queries = self.queries + 1
+            self._snapshots[key] = result
+        return result
+
+
+remote_catalog = RemoteCatalog()
+
+
+class RemoteSql(object):
+    """Run a batch of SQL statements in one remote 'psql' session.
+
+    Each statement is a separate round trip if we use 'psql -c', so we
+    collect the statements and send them to 'psql' as a script.  An '\\echo'
+    before each statement marks the start of its output, so we can return
+    the result of each statement.
 
-def _run_remote_as_user(site_info, sql):
-    """Run a remote command as the user of the database.
+    The script stops at the first error ('ON_ERROR_STOP').  The statements
+    are not run in a transaction, so we can 'CREATE DATABASE'.
 
-    We need to log into the database as the owner to delete the database.
     """
-    pg_data = _pg_data_database(site_info)
-    with shell_env(**pg_data):
-        result = run('psql -X {} -U {} -d postgres -t -A -c "{}"'.format(
-            _db_host(site_info),
-            site_info.db_name,
-            sql,
-        ))
+
+    # statements which change the catalog (see 'RemoteCatalog')
+    DDL = re.compile(r'^(ALTER|CREATE|DO|DROP|REASSIGN)\b', re.IGNORECASE)
+    MARKER = '__fabric_sql_{}__'
+
+    def __init__(self, site_info, as_user=False):
+        """Connect as the 'postgres' user (or the user of the database)."""
+        self.as_user = as_user
+        self.site_info = site_info
+        self._statements = []
+
+    def __len__(self):
+        return len(self._statements)
+
+    def _command(self):
+        if self.as_user:
+            user = '-U {} -d postgres'.format(self.site_info.db_name)
+        else:
+            user = '-U postgres'
+        return (
+            "psql -X {} {} -t -A -q -v ON_ERROR_STOP=1 <<'EOF_SQL'\n"
+            "{}\n"
+            "EOF_SQL".format(_db_host(self.site_info), user, self.script())
+        )
+
+    def _pg_data(self):
+        if self.as_user:
+            return _pg_data_database(self.site_info)
+        else:
+            return _pg_data_postgres(self.site_info)
+
+    def add(self, sql):
+        """Add a statement to the batch (returns the index of the result)."""
+        self._statements.append(sql.strip().rstrip(';'))
+        return len(self._statements) - 1
+
+    def parse(self, out):
+        """Split the output of the script into a result for each statement."""
+        markers = dict(
+            (self.MARKER.format(count), count)
+            for count in range(len(self._statements))
+        )
+        result = [[] for sql in self._statements]
+        current = None
+        for line in out.splitlines():
+            line = line.strip()
+            if line in markers:
+                current = result[markers[line]]
+            elif current is not None and line:
+                current.append(line)
+        return ['\n'.join(lines) for lines in result]
+
+    def run(self):
+        """Run the statements and return a list of results (as strings)."""
+        if not self._statements:
+            return []
+        ddl = any(self.DDL.match(sql) for sql in self._statements)
+        try:
+            with shell_env(**self._pg_data()):
+                out = run(self._command())
+        finally:
+            if ddl:
+                remote_catalog.invalidate(self.site_info)
+        result = self.parse(out)
+        self._statements = []
+        return result
+
+    def script(self):
+        lines = []
+        for count, sql in enumerate(self._statements):
+            lines.append('\\echo {}'.format(self.MARKER.format(count)))
+            lines.append('{};'.format(sql))
+        return '\n'.join(lines)
+
+
+def missing_dbs(site_infos, user_names, database_names):
+    """The roles and databases which do not exist yet.
+
+    Returns a list of '(site_info, create_user, create_database)' for the
+    sites which need a role or a database (or both).
+
+    """
+    result = []
+    for site_info in site_infos:
+        create_user = site_info.db_name not in user_names
+        create_database = site_info.db_name not in database_names
+        if create_user or create_database:
+            result.append((site_info, create_user, create_database))
     return result
 
 
@@ -140,31 +478,54 @@ def database_name(site_info, workflow=None):
 
 
 def drop_local_database(database_name):
+    local_pool.close(database_name)
     sql = _sql_drop_database(database_name)
     _run_local(sql)
 
 
-def drop_remote_database(site_info, workflow):
-    sql = _sql_drop_database(database_name(site_info, workflow))
-    _run_remote_as_user(site_info, sql)
+def local_database_create(database_name):
+    sql = _sql_database_create(database_name, None)
+    _run_local(sql)
 
 
-def drop_remote_user(site_info):
-    sql = _sql_drop_user(site_info.db_name)
-    _run_remote(site_info, sql)
+def local_database_clone(database_name, template):
+    """Copy a template database (much quicker than loading the dump again).
 
+    Postgres will not copy a database while anyone is connected to it.
 
-def local_database_create(database_name):
-    sql = _sql_database_create(database_name, None)
+    """
+    local_pool.close(template)
+    sql = _sql_database_clone(database_name, template)
     _run_local(sql)
 
 
+def local_database_size(database_name):
+    result = _run_local(_sql_database_size(database_name))
+    return int(result[0])
+
+
 def local_database_exists(database_name):
     sql = _sql_database_exists(database_name)
-    result = _run_local_psycopg2(sql)
+    result = _run_local(sql)
     return _result_true_or_false(result[0])
 
 
+def dump_format(file_name):
+    """The format of a 'pg_dump' file: 'plain', 'custom' or 'directory'."""
+    if os.path.isdir(file_name):
+        if os.path.exists(os.path.join(file_name, 'toc.dat')):
+            return 'directory'
+        raise TaskError(
+            "'{}' is a folder, but not a 'pg_dump' directory "
+            "format dump".format(file_name)
+        )
+    with open(file_name, 'rb') as f:
+        header = f.read(5)
+    if header == b'PGDMP':
+        return 'custom'
+    return 'plain'
+
+
 def local_load_file(database_name, file_name):
     local(
         "psql -X --set ON_ERROR_STOP=on -U postgres -d {0} --file {1}".format(
@@ -175,6 +536,139 @@ def local_load_file(database_name, file_name):
     )
 
 
+def local_restore_file(database_name, file_name, jobs=1):
+    """Restore a 'pg_dump' file into the local database.
+
+    A 'custom' or 'directory' format dump is restored by 'pg_restore' using
+    'jobs' parallel workers.  A 'plain' SQL file is loaded by 'psql'.
+
+    """
+    file_format = dump_format(file_name)
+    if file_format == 'plain':
+        local_load_file(database_name, file_name)
+    else:
+        local(
+            "pg_restore -U postgres --exit-on-error --jobs={} "
+            "-d {} {}".format(jobs, database_name, file_name),
+            capture=True,
+        )
+    return file_format
+
+
+def local_row_count(database_name):
+    result = _run_local(_sql_row_count(), database_name)
+    return int(result[0])
+
+
+def local_load_stream(database_name, command):
+    """Pipe the output of a shell command into the local database.
+
+    e.g. 'gunzip -c 20150124_0100.sql.gz'.  The load fails if any command in
+    the pipe fails.
+
+    """
+    local(
+        "set -o pipefail; {} | psql -X --set ON_ERROR_STOP=on -U postgres "
+        "-d {}".format(command, database_name),
+        capture=True,
+        shell='/bin/bash',
+    )
+
+
+def fast_load_options(settings=FAST_LOAD_SETTINGS):
+    """The 'PGOPTIONS' for 'psql' and 'pg_restore' in fast load mode."""
+    return ' '.join(
+        '-c {}={}'.format(name, value) for name, value in settings
+    )
+
+
+def local_analyze(database_name):
+    _run_local('ANALYZE;', database_name)
+
+
+def local_restore_section(database_name, file_name, section, jobs=1):
+    """Restore one section of a 'custom' or 'directory' format dump.
+
+    'section' is 'pre-data' (tables), 'data' or 'post-data' (indexes and
+    constraints).
+
+    """
+    local(
+        "pg_restore -U postgres --exit-on-error --jobs={} --section={} "
+        "-d {} {}".format(jobs, section, database_name, file_name),
+        capture=True,
+    )
+
+
+def local_owned_relations(database_name, user_name):
+    """The relations owned by the user in each schema.
+
+    Returns a dict of 'schema: [(name, relkind), ...]'.
+
+    """
+    result = {}
+    rows = local_pool.query(_sql_owned_relations(user_name), database_name)
+    for schema, name, relkind in rows:
+        result.setdefault(schema, []).append((name, relkind))
+    return result
+
+
+def reassign_batches(relations, user_name, batch_size=200):
+    """Split the 'ALTER ... OWNER' statements into batches.
+
+    'relations' is from 'local_owned_relations'.  A batch only contains
+    relations from one schema, so each batch only locks objects in one
+    schema.
+
+    """
+    result = []
+    for schema in sorted(relations):
+        statements = [
+            _sql_alter_owner(schema, name, relkind, user_name)
+            for name, relkind in relations[schema]
+        ]
+        for start in range(0, len(statements), batch_size):
+            result.append(statements[start:start + batch_size])
+    return result
+
+
+def _run_local_batch(args):
+    """Run a batch of statements in one transaction (on its own connection)."""
+    database_name, statements = args
+    pool = LocalConnectionPool()
+    try:
+        connection = pool.connection(database_name)
+        connection.autocommit = False
+        with connection:
+            cursor = connection.cursor()
+            for sql in statements:
+                cursor.execute(sql)
+            cursor.close()
+    finally:
+        pool.close()
+    return len(statements)
+
+
+def local_reassign_batches(database_name, batches, jobs=1):
+    """Run the batches from 'reassign_batches' using 'jobs' connections."""
+    if jobs > 1 and len(batches) > 1:
+        pool = multiprocessing.pool.ThreadPool(min(jobs, len(batches)))
+        try:
+            counts = pool.map(
+                _run_local_batch,
+                [(database_name, statements) for statements in batches],
+            )
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        counts = [
+            _run_local_batch((database_name, statements))
+            for statements in batches
+        ]
+    return sum(counts)
+
+
 def local_reassign_owner(database_name, from_user_name, to_user_name):
     sql = _sql_reassign_owner(from_user_name, to_user_name)
     _run_local(sql, database_name)
@@ -187,33 +681,140 @@ def local_user_create(site_info):
 
 def local_user_exists(site_info):
     sql = _sql_user_exists(site_info.db_name)
-    result = _run_local_psycopg2(sql)
+    result = _run_local(sql)
     return _result_true_or_false(result[0])
 
 
-def remote_database_create(site_info, table_space, workflow=None):
+def remote_database_exists(site_info, workflow=None):
     db_name = database_name(site_info, workflow)
-    sql = _sql_database_create(db_name, table_space)
-    _run_remote(site_info, sql)
+    return remote_catalog.snapshot(site_info).database_exists(db_name)
+
+
+def remote_database_size(site_info, workflow=None):
+    """The size of the database in bytes (or 'None' if we can't find out)."""
+    db_name = database_name(site_info, workflow)
+    snapshot = remote_catalog.snapshot(site_info)
+    if snapshot.database_exists(db_name):
+        return snapshot.database_size(db_name)
+    return None
+
+
+def remote_user_exists(site_info):
+    return remote_catalog.snapshot(site_info).user_exists(site_info.db_name)
+
+
+def remote_create_db(site_info, table_space, workflow=None):
+    """Create the role (if it doesn't exist) and the database.
+
+    The statements are run in one remote 'psql' session.  If we have a
+    catalog snapshot, it tells us if the role exists.  If not, the role is
+    created by a 'DO' block (if it doesn't exist).
+
+    """
+    db_name = database_name(site_info, workflow)
+    batch = RemoteSql(site_info)
+    snapshot = remote_catalog.cached(site_info)
+    if snapshot is None:
+        batch.add(_sql_user_create_if_not_exists(
+            site_info.db_name, site_info.db_pass
+        ))
+    elif not snapshot.user_exists(site_info.db_name):
+        batch.add(_sql_user_create(site_info.db_name, site_info.db_pass))
+    batch.add(_sql_database_create(db_name, table_space))
     # amazon rds the 'postgres' user sets the owner (after the database is created)
-    sql = _sql_database_owner(db_name, site_info.db_name)
-    _run_remote(site_info, sql)
+    batch.add(_sql_database_owner(db_name, site_info.db_name))
+    batch.run()
 
 
-def remote_database_exists(site_info, workflow=None):
+def remote_catalog_names(site_info):
+    """The names of the roles and databases on the server.
+
+    Returns '(user_names, database_names)' as sets.
+
+    """
+    snapshot = remote_catalog.snapshot(site_info)
+    return (set(snapshot.roles), set(snapshot.databases.keys()))
+
+
+def remote_create_dbs(
+        site_infos, table_space=None, dry_run=False, chunk_size=10):
+    """Create the missing roles and databases for the sites on a server.
+
+    The catalog is read once (see 'remote_catalog_names').  The statements
+    are run in one 'psql' session for every 'chunk_size' sites, so we don't
+    ask the server to create too many databases at once.
+
+    Returns the list from 'missing_dbs' (nothing is created if 'dry_run').
+
+    """
+    if not site_infos:
+        return []
+    user_names, database_names = remote_catalog_names(site_infos[0])
+    result = missing_dbs(site_infos, user_names, database_names)
+    if not dry_run:
+        chunk_size = max(1, int(chunk_size))
+        for start in range(0, len(result), chunk_size):
+            batch = RemoteSql(site_infos[0])
+            for site_info, create_user, create_database in result[
+                    start:start + chunk_size]:
+                if create_user:
+                    batch.add(_sql_user_create(
+                        site_info.db_name, site_info.db_pass
+                    ))
+                if create_database:
+                    batch.add(_sql_database_create(
+                        site_info.db_name, table_space
+                    ))
+                    batch.add(_sql_database_owner(
+                        site_info.db_name, site_info.db_name
+                    ))
+            batch.run()
+    return result
+
+
+def _remote_drop(batch, exists, sql):
+    """Run 'sql' (to drop something) in one remote 'psql' session.
+
+    'exists' is a function which is given a 'CatalogSnapshot'.  If we don't
+    have a snapshot, the catalog is read in the same session (before the
+    'DROP').  Returns 'True' if the object existed.
+
+    """
+    snapshot = remote_catalog.cached(batch.site_info)
+    if snapshot is None:
+        catalog = batch.add(_sql_catalog())
+        batch.add(sql)
+        result = exists(CatalogSnapshot(batch.run()[catalog]))
+    else:
+        result = exists(snapshot)
+        if result:
+            batch.add(sql)
+            batch.run()
+    return result
+
+
+def remote_drop_db(site_info, workflow=None):
+    """Drop the database (if it exists).
+
+    Returns 'True' if the database existed.
+
+    """
     db_name = database_name(site_info, workflow)
-    sql = _sql_database_exists(db_name)
-    result = _run_remote(site_info, sql)
-    return _result_true_or_false(result)
+    return _remote_drop(
+        RemoteSql(site_info, as_user=True),
+        lambda snapshot: snapshot.database_exists(db_name),
+        _sql_drop_database_if_exists(db_name),
+    )
 
 
-def remote_user_create(site_info):
-    """Create the user role for the database."""
-    sql = _sql_user_create(site_info.db_name, site_info.db_pass)
-    _run_remote(site_info, sql)
+def remote_drop_user(site_info):
+    """Drop the role (if it exists).
 
+    Returns 'True' if the role existed.
 
-def remote_user_exists(site_info):
-    sql = _sql_user_exists(site_info.db_name)
-    result = _run_remote(site_info, sql)
-    return _result_true_or_false(result)
+    """
+    return _remote_drop(
+        RemoteSql(site_info),
+        lambda snapshot: snapshot.user_exists(site_info.db_name),
+        _sql_drop_user_if_exists(site_info.db_name),
+    )
@@ -1,35 +1,61 @@
 """Find the server name from the pillar folder."""
 
-import os
-import yaml
-
-from lib.error import (
-    SiteNotFoundError,
-    TaskError,
+from lib.error import TaskError
+from lib.pillar import PillarIndex
+from lib.siteinfo import (
+    minion_settings,
+    SiteInfo,
 )
-from lib.siteinfo import SiteInfo
 
 
 def get_server_name(pillar_folder, domain):
-    result = None
-    with open(os.path.join(pillar_folder, 'top.sls'), 'r') as f:
-        data = yaml.load(f.read())
-        base = data.get('base')
-        for k, v in base.items():
-            if '*' in k:
-                pass
-            else:
-                try:
-                    info = SiteInfo(k, domain, pillar_folder)
-                    result = k
-                except SiteNotFoundError:
-                    pass
-    if not result:
+    return PillarIndex(pillar_folder).minion_id(domain)
+
+
+def _get_sites(index, minion_id):
+    if minion_id not in index.minions():
+        message = index.errors.get(minion_id) or "is not in 'top.sls'"
         raise TaskError(
-            "cannot find '{}' in pillar '{}'.".format(domain, pillar_folder)
+            "cannot read the pillar for '{}': {}".format(minion_id, message)
         )
-    if '*' in result:
-        raise TaskError(
-            "'{}' does not appear to be a valid host name".format(result)
+    pillar = index.pillar(minion_id)
+    # the sites on the minion share one copy of the minion settings
+    settings = minion_settings(pillar)
+    return [
+        SiteInfo(
+            minion_id,
+            domain,
+            index.pillar_folder,
+            pillar=pillar,
+            settings=settings,
         )
-    return result
+        for domain in sorted(pillar.get('sites') or {})
+    ]
+
+
+def get_live_sites(pillar_folder):
+    """The 'SiteInfo' for each site on the live (not testing) minions."""
+    index = PillarIndex(pillar_folder)
+    result = []
+    for minion_id in index.minions():
+        if not index.is_testing(minion_id):
+            result = result + _get_sites(index, minion_id)
+    return sorted(result, key=lambda site_info: site_info.domain)
+
+
+def get_postgres_sites(pillar_folder, minion_id):
+    """The 'SiteInfo' for each postgres site on the minion (sorted by domain).
+
+    The pillar for the minion is only read and merged once.
+
+    """
+    return [
+        site_info
+        for site_info in _get_sites(PillarIndex(pillar_folder), minion_id)
+        if site_info.is_postgres
+    ]
+
+
+def get_server_name_test(pillar_folder, domain):
+    """Find the testing server for the domain."""
+    return PillarIndex(pillar_folder).minion_id(domain, testing=True)
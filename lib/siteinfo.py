@@ -1,23 +1,141 @@
-import fnmatch
+import functools
 import os
-import yaml
 
 from lib.error import SiteNotFoundError, TaskError
 from lib.folder import get_pillar_folder, SSL_CERT_NAME, SSL_SERVER_KEY
+from lib.pillar import load_minion_pillar
+
+
+class FrozenDict(dict):
+    """A 'dict' which cannot be changed.
+
+    The 'SiteInfo' caches the dict it returns from 'env', so we don't want a
+    caller to update it.
+
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("'{}' object cannot be changed".format(
+            self.__class__.__name__
+        ))
+
+    __delitem__ = _immutable
+    __setitem__ = _immutable
+    clear = _immutable
+    pop = _immutable
+    popitem = _immutable
+    setdefault = _immutable
+    update = _immutable
+
+
+def memoize(method):
+    """Cache the result of a 'SiteInfo' method (which has no parameters).
+
+    The pillar does not change after the 'SiteInfo' is created, so the
+    result is calculated on the first call.  Exceptions are not cached (so
+    they are raised on every call).
+
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self):
+        if name not in self._memo:
+            self._memo[name] = method(self)
+        return self._memo[name]
+    return wrapper
+
+
+def minion_settings(pillar):
+    """The pillar for a minion without the 'sites'.
+
+    A 'SiteInfo' only needs the settings for its own site (a 'SiteRecord')
+    and the settings for the minion.
+
+    """
+    return dict(
+        (key, value) for key, value in pillar.items() if key != 'sites'
+    )
+
+
+class SiteRecord(object):
+    """The settings for a site (which are used by 'SiteInfo').
+
+    When we load the whole estate, a dict for every site uses a lot of
+    memory.  A 'SiteRecord' only keeps the settings we use, in slots.  A
+    setting which is not in the pillar is not set, so the record can be used
+    like the original dict (see 'get' and '__contains__').
+
+    """
+
+    __slots__ = (
+        'amazon',
+        'backup',
+        'celery',
+        'compress',
+        'db_pass',
+        'db_type',
+        'db_user',
+        'env',
+        'ftp',
+        'lan',
+        'package',
+        'packages',
+        'profile',
+        'ssl',
+        'test',
+        'uwsgi_port',
+        'workflow',
+    )
+
+    def __init__(self, settings):
+        for key in self.__slots__:
+            if key in settings:
+                setattr(self, key, settings[key])
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def get(self, key, default=None):
+        if key in self.__slots__:
+            return getattr(self, key, default)
+        return default
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
 
 
 class SiteInfo(object):
 
-    def __init__(self, minion_id, domain, pillar_folder=None):
+    def __init__(
+            self, minion_id, domain, pillar_folder=None, pillar=None,
+            settings=None):
+        """Load and check the pillar for the minion.
+
+        If we already have the merged pillar for the minion (see
+        'lib.pillar.PillarIndex'), then pass it in as 'pillar'.  If we are
+        creating a 'SiteInfo' for each site on the minion, pass in the
+        'minion_settings' as 'settings', so they can share one copy.
+
+        """
+        self._memo = {}
         self._minion_id = minion_id
         self._domain = domain
         self._pillar_folder = pillar_folder or get_pillar_folder()
-        self._pillar = self._load()
+        if pillar is None:
+            pillar = self._load()
+        self._pillar = pillar
         self._media_root = self._get_media_root()
         self._verify_profile()
         self._verify_sites()
         self._verify_site()
         self._verify_database_settings()
+        # the other sites are only needed to check the pillar (and to find
+        # out if this is a postgres server)
+        self._is_postgres_server()
+        if settings is None:
+            settings = minion_settings(pillar)
+        self._pillar = settings
 
     def _get_media_root(self):
         return '/home/web/repo/project/{}/files/'.format(self._domain)
@@ -67,6 +185,7 @@ class SiteInfo(object):
             result = pip['pypirc']
         return result
 
+    @memoize
     def _get_site(self):
         sites = self._get('sites')
         if self._domain not in sites:
@@ -75,7 +194,7 @@ class SiteInfo(object):
                     self._domain, sites.keys()
                 )
             )
-        return sites[self._domain]
+        return SiteRecord(sites[self._domain])
 
     def _get_setting(self, key):
         site = self._get_site()
@@ -85,6 +204,7 @@ class SiteInfo(object):
             )
         return site.get(key)
 
+    @memoize
     def _is_postgres_server(self):
         """do any of the sites use postgres"""
         result = False
@@ -104,58 +224,7 @@ class SiteInfo(object):
     #        return False
 
     def _load(self):
-        result = {}
-        with open(os.path.join(self._pillar_folder, 'top.sls'), 'r') as f:
-            data = yaml.load(f.read())
-            base = data.get('base')
-            for k, v in base.items():
-                # unix style file-name match
-                if self._match(self._minion_id, k):
-                    for name in v:
-                        if isinstance(name, dict):
-                            # top.sls file has a dict e.g. '- match: list'
-                            pass
-                        else:
-                            attr = self._parse(name)
-                            # will contain no more than one key (see above)
-                            for key in attr.keys():
-                                if key in result:
-                                    raise TaskError(
-                                        "key '{}' is already contained in "
-                                        "'{}".format(key, self._minion_id)
-                                    )
-                            result.update(attr)
-        return result
-
-    def _match(self, minion_id, salt_top):
-        result = fnmatch.fnmatch(minion_id, salt_top)
-        if not result:
-            for item in salt_top.split(','):
-                result = fnmatch.fnmatch(minion_id, item)
-                if result:
-                    break
-        return result
-
-    def _parse(self, config):
-        """Parse the config from the 'top.sls' file.
-
-        e.g::
-
-          - config.django
-          - config.nginx
-
-        """
-        names = config.split('.')
-        file_name = os.path.join(self._pillar_folder, *names)
-        file_name = file_name + '.sls'
-        with open(file_name, 'r') as fa:
-            attr = yaml.load(fa.read())
-            if len(attr) > 1:
-                raise TaskError(
-                    "Unexpected state: 'sls' file contains more "
-                    "than one key: {}".format(file_name)
-                )
-        return attr
+        return load_minion_pillar(self._pillar_folder, self._minion_id)
 
     def _ssl_cert(self, domain):
         return os.path.join(
@@ -360,6 +429,7 @@ class SiteInfo(object):
                 self._verify_lan_not_ssl(settings)
         self._verify_no_duplicate_uwsgi_ports(sites)
 
+    @memoize
     def env(self):
         """Return a dict suitable for use with the fabric 'shell_env' command.
 
@@ -372,6 +442,8 @@ class SiteInfo(object):
         be properly escapted by 'shell_env' command so use the
         'generate_secret_key' command from 'django-extensions' until you get
         one without the '$' character.
+
+        Note: the dict is built on the first call and cannot be changed.
         """
         result = {
             'ALLOWED_HOSTS': self.domain,
@@ -410,9 +482,10 @@ class SiteInfo(object):
                 'AWS_S3_ACCESS_KEY_ID': amazon.get('aws_s3_access_key_id'),
                 'AWS_S3_SECRET_ACCESS_KEY': amazon.get('aws_s3_secret_access_key'),
             })
-        return result
+        return FrozenDict(result)
 
     @property
+    @memoize
     def compress(self):
         """Use Compressor with Amazon unless 'compress' flag is set 'False'."""
         site = self._get_site()
@@ -420,6 +493,7 @@ class SiteInfo(object):
         return result and self.is_amazon
 
     @property
+    @memoize
     def db_host(self):
         if self._is_postgres_server():
             settings = self._get('postgres_settings')
@@ -444,6 +518,7 @@ class SiteInfo(object):
         return self._get_setting('db_pass')
 
     @property
+    @memoize
     def db_user(self):
         """MySQL has a maximum length for a user name of 16 characters.
 
@@ -454,7 +529,7 @@ class SiteInfo(object):
         site = self._get_site()
         result = site.get('db_user')
         if not result:
-            result = self._site_name
+            result = self.db_name
         if self.is_mysql and len(result) > 16:
             raise TaskError(
                 "maximum length of user name for mysql is 16 characters:"
@@ -467,6 +542,7 @@ class SiteInfo(object):
         return self._domain
 
     @property
+    @memoize
     def is_amazon(self):
         # keys are set in 'global/amazon.sls'
         amazon_key = bool(self._get_none('amazon'))
@@ -483,6 +559,7 @@ class SiteInfo(object):
         return amazon_key and amazon_site
 
     @property
+    @memoize
     def is_celery(self):
         site = self._get_site()
         if 'celery' in site:
@@ -490,9 +567,11 @@ class SiteInfo(object):
         else:
             return False
 
+    @memoize
     def is_django(self):
         return self._get_setting('profile') == 'django'
 
+    @memoize
     def is_ftp(self):
         site = self._get_site()
         if 'ftp' in site:
@@ -501,18 +580,22 @@ class SiteInfo(object):
             return False
 
     @property
+    @memoize
     def is_mysql(self):
         return self._get_setting('db_type') == 'mysql'
 
     @property
+    @memoize
     def is_php(self):
         return self._get_setting('profile') in ('php', 'apache_php')
 
     @property
+    @memoize
     def is_postgres(self):
         return self._get_setting('db_type') == 'psql'
 
     @property
+    @memoize
     def is_testing(self):
         """server and the site must be set-up for testing."""
         result = bool(self._get_none('testing'))
@@ -521,6 +604,7 @@ class SiteInfo(object):
         return result
 
     @property
+    @memoize
     def is_workflow(self):
         site = self._get_site()
         if 'workflow' in site:
@@ -539,6 +623,7 @@ class SiteInfo(object):
     #    return result
 
     @property
+    @memoize
     def has_database(self):
         db_type = self._get_setting('db_type')
         if db_type in ('psql', 'mysql'):
@@ -549,7 +634,7 @@ class SiteInfo(object):
             # this should already be checked in '_verify_database_settings'
             raise TaskError(
                 "site '{}' has an unknown database "
-                "type: {}".format(self._site_name, db_type)
+                "type: {}".format(self._domain, db_type)
             )
         return result
 
@@ -557,6 +642,7 @@ class SiteInfo(object):
         return self._get_setting('packages')
 
     @property
+    @memoize
     def postgres_pass(self):
         if self._is_postgres_server():
             settings = self._get('postgres_settings')
@@ -0,0 +1,123 @@
+# -*- encoding: utf-8 -*-
+"""Keep a template database for each backup we restore.
+
+Loading a large dump takes minutes.  If the same dump is restored again, the
+test database can be cloned from the template (``CREATE DATABASE ...
+TEMPLATE``) in a few seconds.
+
+A template is named after the hash of the dump file, so a new backup gets a
+new template.  The templates we have made are recorded in a registry (in the
+cache folder).  When the templates use more than the disk budget, the least
+recently used are dropped.
+
+"""
+import hashlib
+import json
+import os
+import time
+
+from lib.folder import (
+    get_cache_folder,
+    write_atomic,
+)
+
+
+# 10 GB of template databases
+TEMPLATE_BUDGET = 10 * 1024 * 1024 * 1024
+
+
+def dump_hash(file_name):
+    """The 'sha1' of a dump file (or of the files in a 'directory' dump)."""
+    if os.path.isdir(file_name):
+        file_names = []
+        for root, dirs, files in os.walk(file_name):
+            for name in files:
+                file_names.append(os.path.join(root, name))
+        file_names.sort()
+    else:
+        file_names = [file_name]
+    result = hashlib.sha1()
+    for name in file_names:
+        result.update(os.path.relpath(name, file_name).encode('utf-8'))
+        with open(name, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                result.update(block)
+    return result.hexdigest()
+
+
+def template_name(digest):
+    return 'template_{}'.format(digest[:16])
+
+
+class TemplateRegistry(object):
+    """The template databases on this workstation.
+
+    Each entry is keyed on the database name and records the dump hash, the
+    site, the size (in bytes) and when the template was last used.
+
+    """
+
+    def __init__(self, file_name=None, budget=TEMPLATE_BUDGET):
+        if file_name is None:
+            file_name = os.path.join(
+                get_cache_folder('postgres'), 'templates.json'
+            )
+        self.budget = budget
+        self.file_name = file_name
+        self._templates = self._load()
+
+    def __contains__(self, name):
+        return name in self._templates
+
+    def _load(self):
+        try:
+            with open(self.file_name) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def add(self, name, digest, size, domain, used=None):
+        self._templates[name] = dict(
+            digest=digest,
+            domain=domain,
+            size=size,
+            used=used or time.time(),
+        )
+
+    def evict(self, keep=None):
+        """Remove the least recently used templates until we are in budget.
+
+        Returns the names of the databases to drop.  The 'keep' template is
+        never evicted (even if it is bigger than the budget).
+
+        """
+        result = []
+        names = sorted(
+            self._templates.keys(),
+            key=lambda name: self._templates[name]['used'],
+        )
+        for name in names:
+            if self.size() <= self.budget:
+                break
+            if name != keep:
+                self.remove(name)
+                result.append(name)
+        return result
+
+    def names(self):
+        return sorted(self._templates.keys())
+
+    def remove(self, name):
+        self._templates.pop(name, None)
+
+    def save(self):
+        write_atomic(
+            self.file_name,
+            lambda f: json.dump(self._templates, f, indent=2, sort_keys=True),
+        )
+
+    def size(self):
+        return sum(item['size'] for item in self._templates.values())
+
+    def touch(self, name, used=None):
+        self._templates[name]['used'] = used or time.time()
@@ -0,0 +1,79 @@
+"""Check the pillar for every minion (before running a salt highstate)."""
+import multiprocessing
+
+from lib.conflict import ConflictIndex
+from lib.error import (
+    SiteNotFoundError,
+    TaskError,
+)
+from lib.pillar import PillarIndex
+from lib.siteinfo import SiteInfo
+
+
+def _validate_minion(args):
+    """Use 'validate_minion' from a pool (which takes one parameter)."""
+    return validate_minion(*args)
+
+
+def conflict_errors(index):
+    """The estate wide conflicts as a list of '(minion_id, message)'."""
+    result = []
+    for conflict in ConflictIndex(index).conflicts():
+        result.append((', '.join(conflict.minions()), conflict.message()))
+    return result
+
+
+def validate_minion(pillar_folder, minion_id, pillar):
+    """Run the 'SiteInfo' checks for a minion.
+
+    The checks for the profile, sites, uWSGI ports and database settings
+    are for the whole minion, so we only need to build a 'SiteInfo' for the
+    first site.
+
+    Returns the error message (or 'None' if the pillar is valid).
+
+    """
+    domains = sorted(pillar['sites'].keys())
+    try:
+        SiteInfo(minion_id, domains[0], pillar_folder, pillar=pillar)
+    except (SiteNotFoundError, TaskError) as e:
+        return e.value
+    return None
+
+
+def validate_all(pillar_folder, processes=None):
+    """Check the pillar for every minion which has 'sites'.
+
+    The pillar is loaded once and the minions are checked by a pool of
+    'processes' worker processes (defaults to the number of CPUs).  Use
+    'processes=1' to check them in this process.
+
+    The database names and database users are then checked across the
+    estate (see 'lib.conflict.ConflictIndex').
+
+    Returns a list of '(minion_id, message)' for the minions which are not
+    valid.
+
+    """
+    index = PillarIndex(pillar_folder)
+    result = sorted(index.errors.items())
+    work = []
+    for minion_id in index.minions():
+        pillar = index.pillar(minion_id)
+        if pillar.get('sites'):
+            work.append((pillar_folder, minion_id, pillar))
+    if processes == 1 or len(work) < 2:
+        messages = [_validate_minion(item) for item in work]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            messages = pool.map(_validate_minion, work)
+        finally:
+            pool.close()
+            pool.join()
+    for item, message in zip(work, messages):
+        if message:
+            minion_id = item[1]
+            result.append((minion_id, message))
+    result = result + conflict_errors(index)
+    return sorted(result)
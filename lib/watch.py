@@ -0,0 +1,163 @@
+"""Reload the pillar when the 'sls' files change.
+
+For long running commands (e.g. a watcher which checks the pillar every
+time you save a file).  The pillar folder is polled for changes to the
+modification time and size of the 'sls' files.  Only the changed files are
+parsed (see 'lib.pillar.pillar_cache') and only the minions which use them
+are checked again.
+
+"""
+import collections
+import os
+import time
+import yaml
+
+from lib.error import TaskError
+from lib.pillar import (
+    pillar_cache,
+    PillarIndex,
+)
+from lib.siteinfo import FrozenDict
+from lib.validate import (
+    conflict_errors,
+    validate_minion,
+)
+
+
+class PillarView(collections.namedtuple(
+        'PillarView', 'version pillars errors changed')):
+    """The pillar at a point in time.
+
+    'pillars' maps the minion to its merged pillar and 'errors' is a list of
+    '(minion_id, message)' (see 'lib.validate.validate_all').  'changed' is
+    the list of minions which were loaded or checked again for this view.
+
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+
+def _config_name(pillar_folder, file_name):
+    """The name used in 'top.sls' for an 'sls' file e.g. 'sites.kb'."""
+    name = os.path.relpath(file_name, pillar_folder)
+    name = os.path.splitext(name)[0]
+    return name.replace(os.sep, '.')
+
+
+class PillarWatcher(object):
+
+    def __init__(self, pillar_folder):
+        self.pillar_folder = os.path.abspath(pillar_folder)
+        self.view = None
+        self._errors = {}
+        self._index = None
+        self._signatures = {}
+
+    def _changed_files(self, signatures):
+        result = set()
+        for file_name, signature in signatures.items():
+            if self._signatures.get(file_name) != signature:
+                result.add(file_name)
+        for file_name in self._signatures:
+            if file_name not in signatures:
+                result.add(file_name)
+        return result
+
+    def _changed_minions(self, index, file_names):
+        """The minions which use any of the changed files."""
+        names = set(
+            _config_name(self.pillar_folder, file_name)
+            for file_name in file_names
+        )
+        result = []
+        for minion_id in index.minions() + sorted(index.errors.keys()):
+            if self._index is None or 'top' in names:
+                result.append(minion_id)
+            elif set(index.sls(minion_id)) & names:
+                result.append(minion_id)
+            elif minion_id not in self._index.minions():
+                # the pillar could not be merged last time
+                result.append(minion_id)
+        return result
+
+    def _invalid_top(self, signatures, message):
+        """A view for a 'top.sls' we cannot read (so we have no minions).
+
+        Every minion is checked again when 'top.sls' is fixed.
+
+        """
+        self._errors = {}
+        self._index = None
+        self._signatures = signatures
+        version = 1 if self.view is None else self.view.version + 1
+        self.view = PillarView(
+            version=version,
+            pillars=FrozenDict(),
+            errors=(('top.sls', message),),
+            changed=(),
+        )
+        return self.view
+
+    def _scan(self):
+        result = {}
+        for root, dirs, files in os.walk(self.pillar_folder):
+            for name in files:
+                if name.endswith('.sls'):
+                    file_name = os.path.join(root, name)
+                    stat = os.stat(file_name)
+                    result[file_name] = (stat.st_mtime, stat.st_size)
+        return result
+
+    def poll(self):
+        """Return a new 'PillarView' if the pillar has changed (or 'None')."""
+        signatures = self._scan()
+        file_names = self._changed_files(signatures)
+        if self.view is not None and not file_names:
+            return None
+        for file_name in file_names:
+            pillar_cache.invalidate(file_name)
+        try:
+            index = PillarIndex(self.pillar_folder)
+        except (IOError, OSError, TaskError, yaml.YAMLError) as e:
+            return self._invalid_top(signatures, getattr(e, 'value', str(e)))
+        changed = self._changed_minions(index, file_names)
+        errors = {}
+        for minion_id in index.minions():
+            if minion_id in changed:
+                pillar = index.pillar(minion_id)
+                message = None
+                if pillar.get('sites'):
+                    message = validate_minion(
+                        self.pillar_folder, minion_id, pillar
+                    )
+            else:
+                message = self._errors.get(minion_id)
+            if message:
+                errors[minion_id] = message
+        errors.update(index.errors)
+        self._errors = errors
+        self._index = index
+        self._signatures = signatures
+        version = 1 if self.view is None else self.view.version + 1
+        self.view = PillarView(
+            version=version,
+            pillars=FrozenDict(
+                (minion_id, index.pillar(minion_id))
+                for minion_id in index.minions()
+            ),
+            errors=tuple(sorted(errors.items()) + conflict_errors(index)),
+            changed=tuple(changed),
+        )
+        return self.view
+
+    def watch(self, callback, interval=1.0):
+        """Call 'callback' with each new 'PillarView' (until interrupted)."""
+        while True:
+            view = self.poll()
+            if view:
+                callback(view)
+            time.sleep(interval)
@@ -0,0 +1,249 @@
+# -*- encoding: utf-8 -*-
+"""A folder (workspace) for each restore.
+
+duplicity restores the backup into a workspace before we move the files to
+the project (or load the database).  The workspaces are created in one root
+folder ('RESTORE_FOLDER' or the cache folder), so they are easy to find and
+clean up.
+
+The last few workspaces are kept (for debugging) as long as they fit in the
+disk budget.  The least recently used are removed first.  We only remove
+folders we created (named 'WORKSPACE_PREFIX...') and never a workspace
+which is still in use by a restore (see 'Workspaces.in_use').  The process
+using a workspace is recorded in a file next to it (not in it), so duplicity
+can restore into the empty workspace.
+
+The root folder should be on the same file system as the project, so the
+restored files can be moved with 'os.rename' (see 'move').
+
+"""
+import errno
+import multiprocessing.pool
+import os
+import shutil
+import tempfile
+import time
+
+from lib.error import TaskError
+from lib.folder import get_cache_folder
+
+
+# 20 GB of old workspaces
+WORKSPACE_BUDGET = 20 * 1024 * 1024 * 1024
+# keep the workspace from the last restore (for debugging)
+WORKSPACE_KEEP = 1
+# don't fill the disk (even if we think the restore will fit)
+WORKSPACE_MIN_FREE = 1024 * 1024 * 1024
+# the name of every workspace starts with this
+WORKSPACE_PREFIX = 'restore-'
+# the process using a workspace e.g. 'restore-kb_couk-abc123.pid' (removed
+# when the workspace is released)
+WORKSPACE_PID = '.pid'
+
+
+def _folder_size(folder):
+    result = 0
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            file_name = os.path.join(root, name)
+            if not os.path.islink(file_name):
+                result = result + os.path.getsize(file_name)
+    return result
+
+
+def _existing(folder):
+    """The folder (or the nearest parent which exists)."""
+    folder = os.path.abspath(folder)
+    while not os.path.exists(folder):
+        folder = os.path.dirname(folder)
+    return folder
+
+
+def _pid_file(folder):
+    return folder.rstrip(os.sep) + WORKSPACE_PID
+
+
+def copy_and_remove(from_to):
+    """Copy a file or folder and then remove the original.
+
+    Returns the number of bytes copied.
+
+    """
+    from_file, to_file = from_to
+    if os.path.isdir(from_file) and not os.path.islink(from_file):
+        result = _folder_size(from_file)
+        shutil.copytree(from_file, to_file, symlinks=True)
+        shutil.rmtree(from_file)
+    else:
+        result = os.path.getsize(from_file)
+        shutil.copy2(from_file, to_file)
+        os.remove(from_file)
+    return result
+
+
+def move(from_to, jobs=1):
+    """Move each '(from_file, to_file)'.
+
+    A file or folder on the same file system is renamed.  The others are
+    copied ('jobs' at a time) and then removed.
+
+    Returns a dict with the number 'renamed' and 'copied' and the 'bytes'
+    copied.
+
+    """
+    copy = []
+    renamed = 0
+    for from_file, to_file in from_to:
+        folder = os.path.dirname(to_file)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        try:
+            os.rename(from_file, to_file)
+            renamed = renamed + 1
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            copy.append((from_file, to_file))
+    if len(copy) > 1 and jobs > 1:
+        pool = multiprocessing.pool.ThreadPool(min(jobs, len(copy)))
+        try:
+            sizes = pool.map(copy_and_remove, copy)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        sizes = [copy_and_remove(item) for item in copy]
+    return dict(bytes=sum(sizes), copied=len(copy), renamed=renamed)
+
+
+def same_file_system(folder, other):
+    """Are the folders (or their nearest parents) on the same file system?"""
+    return os.stat(_existing(folder)).st_dev == os.stat(_existing(other)).st_dev
+
+
+def free_space(folder):
+    """The space available to us (in bytes) on the file system."""
+    stat = os.statvfs(folder)
+    return stat.f_bavail * stat.f_frsize
+
+
+def workspace_root(near=None):
+    """The 'RESTORE_FOLDER' environment variable (or the cache folder).
+
+    If the cache folder is not on the same file system as the 'near' folder
+    (e.g. the project folder), then we use a '.restore' folder next to it.
+
+    """
+    result = os.environ.get('RESTORE_FOLDER')
+    if not result:
+        result = get_cache_folder('restore')
+        if near and not same_file_system(result, near):
+            parent = _existing(os.path.dirname(os.path.abspath(near)))
+            result = os.path.join(parent, '.restore')
+    if not os.path.exists(result):
+        os.makedirs(result)
+    return result
+
+
+class Workspaces(object):
+    """The restore workspaces in the 'root' folder."""
+
+    def __init__(
+            self, root=None, budget=WORKSPACE_BUDGET, keep=WORKSPACE_KEEP,
+            min_free=WORKSPACE_MIN_FREE):
+        self.budget = budget
+        self.keep = keep
+        self.min_free = min_free
+        self.root = root or workspace_root()
+
+    def cleanup(self, keep=None):
+        """Remove the old workspaces.
+
+        The newest 'keep' workspaces are kept if they fit in the budget.
+        Returns the list of folders which were removed.
+
+        """
+        if keep is None:
+            keep = self.keep
+        result = []
+        total = 0
+        count = 0
+        for used, folder, size in self.workspaces():
+            if self.in_use(folder):
+                continue
+            if count < keep and total + size <= self.budget:
+                total = total + size
+            else:
+                shutil.rmtree(folder)
+                if os.path.exists(_pid_file(folder)):
+                    os.remove(_pid_file(folder))
+                result.append(folder)
+            count = count + 1
+        return result
+
+    def create(self, name, required=0):
+        """Create a new workspace.
+
+        The old workspaces are removed first.  'required' is the number of
+        bytes we expect the restore to need.
+
+        """
+        # the new workspace will be one of the ones we keep
+        self.cleanup(max(self.keep - 1, 0))
+        available = free_space(self.root)
+        if available < required + self.min_free:
+            raise TaskError(
+                "Not enough free space in '{}' to restore '{}' ({} bytes "
+                "free, but we need {} bytes)".format(
+                    self.root, name, available, required + self.min_free
+                )
+            )
+        result = tempfile.mkdtemp(
+            prefix='{}{}-'.format(WORKSPACE_PREFIX, name), dir=self.root
+        )
+        with open(_pid_file(result), 'w') as f:
+            f.write(str(os.getpid()))
+        return result
+
+    def in_use(self, folder):
+        """Is a restore still using the workspace?
+
+        A workspace which was not released by a process which has finished
+        (e.g. it crashed) is not in use.
+
+        """
+        try:
+            with open(_pid_file(folder)) as f:
+                pid = int(f.read().strip())
+        except (IOError, OSError, ValueError):
+            return False
+        try:
+            os.kill(pid, 0)
+        except OSError as e:
+            return e.errno != errno.ESRCH
+        return True
+
+    def release(self, folder):
+        """We have finished with the workspace.
+
+        The workspace is marked as used (so it is the last to be removed).
+
+        """
+        if os.path.exists(folder):
+            if os.path.exists(_pid_file(folder)):
+                os.remove(_pid_file(folder))
+            now = time.time()
+            os.utime(folder, (now, now))
+        return self.cleanup()
+
+    def workspaces(self):
+        """Our workspaces (newest first) as '(used, folder, size)'."""
+        result = []
+        for name in os.listdir(self.root):
+            folder = os.path.join(self.root, name)
+            if name.startswith(WORKSPACE_PREFIX) and os.path.isdir(folder):
+                result.append(
+                    (os.path.getmtime(folder), folder, _folder_size(folder))
+                )
+        result.sort(reverse=True)
+        return result
@@ -0,0 +1,41 @@
+"""Read YAML files.
+
+All the YAML files in the project (the salt pillar, the browser tests and
+'setup.yaml') are plain data, so we use the safe loader.  The libyaml
+(C) version of the loader is much faster, so use it if PyYAML was built
+with it.
+
+"""
+import collections
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+class OrderedLoader(SafeLoader):
+    """A safe loader which keeps the order of the keys in a mapping."""
+
+
+def _construct_ordered(loader, node):
+    loader.flatten_mapping(node)
+    return collections.OrderedDict(loader.construct_pairs(node))
+
+
+OrderedLoader.add_constructor(
+    yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+    _construct_ordered,
+)
+
+
+def yaml_load(stream, ordered=False):
+    """Parse a YAML document from a string or a file.
+
+    If 'ordered' is set, mappings are loaded into an 'OrderedDict' (the
+    order matters in the salt 'top.sls' file).
+
+    """
+    return yaml.load(stream, Loader=OrderedLoader if ordered else SafeLoader)
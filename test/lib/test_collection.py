@@ -0,0 +1,96 @@
+# -*- encoding: utf-8 -*-
+import shutil
+import tempfile
+
+import pytest
+
+from lib.collection import (
+    BackupCatalog,
+    CatalogCache,
+    format_time,
+    parse_collection_status,
+)
+from lib.error import TaskError
+
+
+COLLECTION_STATUS = """
+Local and Remote metadata are synchronized, no sync needed.
+Last full backup date: Sat Jan 24 01:00:04 2015
+Collection Status
+-----------------
+Connecting with backend: BackendWrapper
+Archive dir: /home/patrick/.cache/duplicity/1234
+
+Found 1 secondary backup chain.
+Secondary chain 1 of 1:
+-------------------------
+Chain start time: Sat Jan 17 01:00:03 2015
+Chain end time: Sat Jan 17 01:00:03 2015
+Number of contained backup sets: 1
+Total number of contained volumes: 2
+ Type of backup set:                            Time:      Num volumes:
+                Full         Sat Jan 17 01:00:03 2015                 2
+-------------------------
+
+
+Found primary backup chain with matching signature chain:
+-------------------------
+Chain start time: Sat Jan 24 01:00:04 2015
+Chain end time: Sun Jan 25 01:00:02 2015
+Number of contained backup sets: 2
+Total number of contained volumes: 4
+ Type of backup set:                            Time:      Num volumes:
+                Full         Sat Jan 24 01:00:04 2015                 3
+         Incremental         Sun Jan 25 01:00:02 2015                 1
+-------------------------
+No orphaned or incomplete backup sets found.
+"""
+
+
+def test_catalog():
+    catalog = BackupCatalog(parse_collection_status(COLLECTION_STATUS))
+    assert 2 == len(catalog.chains)
+    assert ['full', 'full', 'incremental'] == [
+        item['type'] for item in catalog.sets()
+    ]
+    assert 2 == len(catalog.full_sets())
+    assert 6 == catalog.volumes()
+    assert '2015-01-25 01:00:02' == format_time(catalog.find(-1)['time'])
+    assert '2015-01-17 01:00:03' == format_time(catalog.find(0)['time'])
+
+
+def test_catalog_find_invalid():
+    catalog = BackupCatalog(parse_collection_status(COLLECTION_STATUS))
+    for index in (3, -4, 'newest'):
+        with pytest.raises(TaskError) as e:
+            catalog.find(index)
+        assert "There are 3 backup sets" in e.value.value
+
+
+def test_catalog_find_no_sets():
+    with pytest.raises(TaskError) as e:
+        BackupCatalog([]).find(-1)
+    assert "there are no backup sets" in e.value.value
+
+
+def test_catalog_cache():
+    folder = tempfile.mkdtemp()
+    try:
+        cache = CatalogCache(folder)
+        assert cache.get('kb_couk', 'backup') is None
+        catalog = BackupCatalog(parse_collection_status(COLLECTION_STATUS))
+        cache.put('kb_couk', 'backup', catalog)
+        result = cache.get('kb_couk', 'backup')
+        assert catalog.sets() == result.sets()
+        assert cache.get('kb_couk', 'files') is None
+        # too old
+        cache = CatalogCache(folder, ttl=-1)
+        assert cache.get('kb_couk', 'backup') is None
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_parse_collection_status():
+    chains = parse_collection_status(COLLECTION_STATUS)
+    assert [False, True] == [chain['primary'] for chain in chains]
+    assert [3, 1] == [item['volumes'] for item in chains[1]['sets']]
@@ -0,0 +1,55 @@
+# -*- encoding: utf-8 -*-
+from lib.conflict import ConflictIndex
+from lib.pillar import PillarIndex
+from test.lib.test_siteinfo import get_test_data_folder
+
+
+def _conflict_index(folder_name):
+    return ConflictIndex(PillarIndex(get_test_data_folder(folder_name)))
+
+
+def test_conflicts():
+    assert [] == _conflict_index('data').conflicts()
+
+
+def test_conflicts_db_user():
+    """The same 'db_user' for sites on different minions."""
+    result = _conflict_index('data_dup_db_user').conflicts()
+    assert 1 == len(result)
+    conflict = result[0]
+    assert 'db_user' == conflict.setting
+    assert 'kb' == conflict.value
+    assert [('drop', 'kb_couk'), ('drop-temp', 'pk_couk')] == conflict.owners
+    assert ['drop', 'drop-temp'] == conflict.minions()
+
+
+def test_conflicts_same_site():
+    """The same site on two minions is not a conflict."""
+    assert [] == _conflict_index('data_dup_domain').conflicts()
+
+
+def test_conflicts_uwsgi_port():
+    """The ports on a minion are checked by 'SiteInfo' (not reported here)."""
+    index = _conflict_index('data_dup_uwsgi_port')
+    assert [] == index.conflicts()
+    assert [
+        ('drop-temp', 'csw_marking'),
+        ('drop-temp', 'csw_test'),
+    ] == index.port_owners('drop-temp', 3032)
+
+
+def test_is_port_free():
+    index = _conflict_index('data')
+    assert not index.is_port_free('drop-temp', 3031)
+    assert not index.is_port_free('drop-temp', '3031')
+    assert index.is_port_free('drop-temp', 3035)
+    assert index.is_port_free('drop', 3031)
+    assert [('drop-temp', 'csw_web')] == index.port_owners('drop-temp', 3031)
+
+
+def test_db_name_owners():
+    index = _conflict_index('data_dup_domain')
+    assert [
+        ('drop', 'kb_couk'),
+        ('drop-temp', 'kb_couk'),
+    ] == index.db_name_owners('kb_couk')
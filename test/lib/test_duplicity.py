@@ -1,9 +1,22 @@
 # -*- encoding: utf-8 -*-
 import json
 import os
+import shutil
 
-from lib.duplicity import Duplicity
-from test.lib.test_siteinfo import get_site_info
+import pytest
+
+from lib.duplicity import (
+    Duplicity,
+    filter_files,
+    load_seconds,
+    newest_sql,
+    parse_file_list,
+)
+from lib.siteinfo import SiteInfo
+from test.lib.test_siteinfo import (
+    get_site_info,
+    get_test_data_folder,
+)
 
 
 def test_find_sql():
@@ -35,3 +48,129 @@ def test_from_to():
         ),
     ]
     assert result == expect
+
+
+def test_filter_files():
+    file_names = [
+        'public',
+        'public/booking',
+        'public/booking/logo.png',
+        'public/bookings.txt',
+        'private/booking/invoice.pdf',
+    ]
+    assert [
+        'public/booking',
+        'public/booking/logo.png',
+    ] == filter_files(file_names, 'public/booking/')
+
+
+def test_get_path_from_to():
+    duplicity = Duplicity(get_site_info(), 'files', path_filter='booking')
+    assert [
+        ('/tmp/restore/booking', '/media/booking'),
+    ] == duplicity._get_path_from_to('/tmp/restore', '/media', 'booking')
+
+
+def test_newest_sql():
+    file_names = [
+        '20150123_0100.sql',
+        '20150124_0100.sql.gz',
+        '20150122_0100.dump',
+        'media',
+    ]
+    assert '20150124_0100.sql.gz' == newest_sql(file_names)
+
+
+def test_newest_sql_none():
+    assert newest_sql(['media', 'media/logo.png']) is None
+
+
+def test_parse_file_list():
+    out = (
+        "Local and Remote metadata are synchronized, no sync needed.\n"
+        "Last full backup date: Sat Jan 24 01:00:04 2015\n"
+        "Sat Jan 24 01:00:03 2015 .\n"
+        "Sat Jan 24 01:00:01 2015 20150124_0100.sql\n"
+        "Fri Jan  2 13:11:52 2015 media/my logo.png\n"
+    )
+    assert ['20150124_0100.sql', 'media/my logo.png'] == parse_file_list(out)
+
+
+def test_stream_mysql(capsys):
+    site_info = SiteInfo(
+        'drop-temp', 'hatherleigh_info', get_test_data_folder('data_php')
+    )
+    with pytest.raises(SystemExit):
+        Duplicity(site_info, 'backup', stream=True)
+    # fabric 'abort' writes the message to 'stderr' (and exits with 1)
+    assert 'mysql' in capsys.readouterr().err
+
+
+def test_stream_template(capsys):
+    with pytest.raises(SystemExit):
+        Duplicity(get_site_info(), 'backup', stream=True, template=True)
+    assert 'together' in capsys.readouterr().err
+
+
+def test_load_seconds():
+    tasks = [
+        dict(site='kb_couk', task='restore backup', phases=[
+            dict(phase='download', seconds=5.0),
+            dict(phase='load', seconds=30.0),
+        ]),
+        dict(site='kb_couk', task='restore backup', phases=[
+            dict(phase='load', seconds=40.0),
+            dict(phase='reassign', seconds=2.0),
+        ]),
+        # fast
+        dict(site='kb_couk', task='restore backup', phases=[
+            dict(phase='load pre-data', seconds=1.0, fast=True),
+            dict(phase='load data', seconds=10.0, fast=True),
+            dict(phase='load analyze', seconds=3.0, fast=True),
+        ]),
+        dict(site='kb_couk', task='restore backup', error='SystemExit(1,)',
+             phases=[dict(phase='load', seconds=1.0)]),
+        dict(site='kb_couk', task='restore files', phases=[
+            dict(phase='load', seconds=2.0),
+        ]),
+        dict(site='hatherleigh_info', task='restore backup', phases=[
+            dict(phase='load', seconds=3.0),
+        ]),
+    ]
+    assert 40.0 == load_seconds(tasks, 'restore backup', 'kb_couk')
+    assert load_seconds(tasks, 'restore backup', 'csw_web') is None
+
+
+class RestoreFiles(Duplicity):
+    """Restore the test data (instead of running duplicity)."""
+
+    def _restore(self, restore_to, file_to_restore=None):
+        # duplicity 0.8 will only restore a collection to an empty folder
+        if os.listdir(restore_to):
+            raise Exception(
+                "Restore destination directory {} already exists.  Will not "
+                "overwrite.".format(restore_to)
+            )
+        module_folder = os.path.dirname(os.path.realpath(__file__))
+        from_folder = os.path.join(
+            module_folder, 'data', 'duplicity', 'restore_to_files'
+        )
+        for name in os.listdir(from_folder):
+            shutil.copytree(
+                os.path.join(from_folder, name),
+                os.path.join(restore_to, name),
+            )
+
+
+def test_restore_files(capsys, monkeypatch, tmpdir):
+    """Restore the whole 'files' collection into a new workspace."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('cache')))
+    monkeypatch.delenv('RESTORE_FOLDER', raising=False)
+    site_info = SiteInfo(
+        'drop-temp', 'hatherleigh_info', get_test_data_folder('data_php')
+    )
+    RestoreFiles(site_info, 'files').restore()
+    project = tmpdir.join('dev', 'project', site_info.domain)
+    assert ['public'] == os.listdir(str(project))
+    assert 'not restored' not in capsys.readouterr().out
@@ -1,8 +1,15 @@
+import multiprocessing.pool
 import os
+import shutil
+import tempfile
 import unittest
 
 from lib.error import TaskError
-from lib.folder import FolderInfo
+from lib.folder import (
+    FolderInfo,
+    get_cache_folder,
+    write_atomic,
+)
 from lib.siteinfo import SiteInfo
 
 
@@ -79,3 +86,60 @@ class TestFolderInfo(unittest.TestCase):
             '/srv',
             self.folder.srv_folder()
         )
+
+
+class TestCacheFolder(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_home = os.environ.get('XDG_CACHE_HOME')
+        self.folder = tempfile.mkdtemp()
+        os.environ['XDG_CACHE_HOME'] = self.folder
+
+    def tearDown(self):
+        if self.cache_home is None:
+            os.environ.pop('XDG_CACHE_HOME', None)
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.cache_home
+        shutil.rmtree(self.folder)
+
+    def test_cache_folder_threads(self):
+        """Threads can create the same cache folder at the same time."""
+        pool = multiprocessing.pool.ThreadPool(8)
+        try:
+            result = pool.map(get_cache_folder, ['duplicity'] * 32)
+        finally:
+            pool.close()
+            pool.join()
+        expect = os.path.join(self.folder, 'pkimber-fabric', 'duplicity')
+        self.assertEqual(set([expect]), set(result))
+        self.assertTrue(os.path.isdir(expect))
+
+
+class TestWriteAtomic(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.folder, 'data.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_write_atomic(self):
+        write_atomic(self.file_name, lambda f: f.write('apple'))
+        with open(self.file_name) as f:
+            self.assertEqual('apple', f.read())
+        self.assertEqual(['data.txt'], os.listdir(self.folder))
+
+    def test_write_atomic_error(self):
+        """If the write fails, the old file is kept (and nothing is left)."""
+        write_atomic(self.file_name, lambda f: f.write('apple'))
+
+        def write(f):
+            f.write('orange')
+            raise ValueError('cannot write')
+
+        with self.assertRaises(ValueError):
+            write_atomic(self.file_name, write)
+        with open(self.file_name) as f:
+            self.assertEqual('apple', f.read())
+        self.assertEqual(['data.txt'], os.listdir(self.folder))
@@ -0,0 +1,77 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import tempfile
+
+from lib.metrics import (
+    Phases,
+    read_metrics,
+    summary,
+)
+
+
+def test_phases():
+    phases = Phases('restore')
+    with phases.phase('download') as record:
+        record['bytes'] = 2048
+    with phases.phase('load') as record:
+        record['rows'] = 1234
+    assert ['download', 'load'] == [r['phase'] for r in phases.records]
+    lines = phases.lines()
+    assert lines[0].startswith('download: ')
+    assert '2.0 KB' in lines[0]
+    assert '1,234 rows' in lines[1]
+    assert phases.seconds() >= 0
+    assert phases.seconds('load') <= phases.seconds()
+    assert 0 == phases.seconds('analyze')
+
+
+def test_phases_exception():
+    """The phase is recorded, even if it fails."""
+    phases = Phases('restore')
+    try:
+        with phases.phase('load'):
+            raise ValueError()
+    except ValueError:
+        pass
+    assert 1 == len(phases.records)
+
+
+def test_summary():
+    tasks = [
+        dict(task='restore backup', site='kb_couk', seconds=10, phases=[
+            dict(phase='download', seconds=4, bytes=2048),
+            dict(phase='load', seconds=6, rows=100),
+        ]),
+        dict(task='restore backup', site='kb_couk', seconds=20, phases=[]),
+        dict(task='restore backup', site='csw_web', seconds=30, phases=[]),
+        dict(task='restore backup', site='hb_couk', seconds=90, phases=[],
+             error='SystemExit(1,)'),
+        dict(task='restore files', site='hb_couk', seconds=60, phases=[]),
+    ]
+    result = summary(tasks, 'restore backup')
+    assert ['csw_web', 'kb_couk'] == [site['site'] for site in result]
+    kb_couk = result[1]
+    assert 2 == kb_couk['count']
+    assert 15 == kb_couk['seconds']
+    assert 20 == kb_couk['max_seconds']
+    assert 2048 == kb_couk['bytes']
+    assert 100 == kb_couk['rows']
+
+
+def test_write():
+    folder = tempfile.mkdtemp()
+    try:
+        file_name = os.path.join(folder, 'metrics.jsonl')
+        phases = Phases('restore backup', 'kb_couk')
+        with phases.phase('load') as record:
+            record['rows'] = 1234
+        phases.write(file_name)
+        phases.write(file_name, error='failed')
+        result = read_metrics(file_name)
+        assert 2 == len(result)
+        assert 'kb_couk' == result[0]['site']
+        assert 1234 == result[0]['phases'][0]['rows']
+        assert 'failed' == result[1]['error']
+    finally:
+        shutil.rmtree(folder)
@@ -0,0 +1,191 @@
+# -*- encoding: utf-8 -*-
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib.error import TaskError
+from lib.pillar import (
+    PillarCache,
+    PillarIndex,
+    TopMatcher,
+)
+from test.lib.test_siteinfo import get_test_data_folder
+
+
+class TestPillarCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, name, text):
+        file_name = os.path.join(self.folder, name)
+        with open(file_name, 'w') as f:
+            f.write(text)
+        return file_name
+
+    def test_hit(self):
+        cache = PillarCache()
+        file_name = self._write('django.sls', 'django: True\n')
+        self.assertEqual({'django': True}, cache.load(file_name))
+        self.assertEqual({'django': True}, cache.load(file_name))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_changed(self):
+        cache = PillarCache()
+        file_name = self._write('testing.sls', 'testing: True\n')
+        cache.load(file_name)
+        self._write('testing.sls', 'testing: False\nother: 1\n')
+        self.assertEqual(
+            {'testing': False, 'other': 1},
+            cache.load(file_name),
+        )
+        self.assertEqual(2, cache.misses)
+
+    def test_invalidate(self):
+        cache = PillarCache()
+        file_name = self._write('django.sls', 'django: True\n')
+        cache.load(file_name)
+        cache.invalidate(file_name)
+        self.assertNotIn(file_name, cache)
+        cache.load(file_name)
+        self.assertEqual(2, cache.misses)
+
+    def test_lru(self):
+        cache = PillarCache(max_size=2)
+        a = self._write('a.sls', 'a: 1\n')
+        b = self._write('b.sls', 'b: 2\n')
+        c = self._write('c.sls', 'c: 3\n')
+        cache.load(a)
+        cache.load(b)
+        # 'a' is now the most recently used
+        cache.load(a)
+        cache.load(c)
+        self.assertIn(a, cache)
+        self.assertNotIn(b, cache)
+        self.assertIn(c, cache)
+        self.assertEqual(2, len(cache))
+
+    def test_derived(self):
+        cache = PillarCache()
+        file_name = self._write('top.sls', 'base: {}\n')
+        first = cache.derived(file_name, TopMatcher.from_top)
+        self.assertIs(first, cache.derived(file_name, TopMatcher.from_top))
+        self._write('top.sls', "base:\n  'drop': [sites.kb]\n")
+        matcher = cache.derived(file_name, TopMatcher.from_top)
+        self.assertIsNot(first, matcher)
+        self.assertEqual(['drop'], matcher.minion_ids())
+
+    def test_snapshot(self):
+        cache = PillarCache()
+        a = self._write('a.sls', 'a: 1\n')
+        b = self._write('b.sls', 'b: 2\n')
+        cache.load(a)
+        cache.load(b)
+        snapshot = os.path.join(self.folder, 'snapshot.pickle')
+        self.assertTrue(cache.save_snapshot(snapshot))
+        # nothing has changed, so no need to write the snapshot again
+        self.assertFalse(cache.save_snapshot(snapshot))
+        self._write('b.sls', 'b: 22\n')
+        cache = PillarCache()
+        self.assertEqual(2, cache.load_snapshot(snapshot))
+        self.assertEqual({'a': 1}, cache.load(a))
+        self.assertEqual({'b': 22}, cache.load(b))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_top_ordered(self):
+        cache = PillarCache()
+        file_name = self._write(
+            'top.sls', "base:\n  'web': [sites.pk]\n  'drop': [sites.kb]\n"
+        )
+        self.assertEqual(['web', 'drop'], list(cache.load(file_name)['base']))
+
+    def test_snapshot_missing(self):
+        cache = PillarCache()
+        snapshot = os.path.join(self.folder, 'snapshot.pickle')
+        self.assertEqual(0, cache.load_snapshot(snapshot))
+
+
+class TestPillarIndex(unittest.TestCase):
+
+    def test_domains(self):
+        index = PillarIndex(get_test_data_folder('data'))
+        self.assertEqual(
+            ['csw_mail', 'csw_web', 'test_crm', 'test_nodb'],
+            index.domains()
+        )
+
+    def test_minion_id(self):
+        index = PillarIndex(get_test_data_folder('data'))
+        self.assertEqual('drop-temp', index.minion_id('csw_web'))
+
+    def test_minion_id_ambiguous(self):
+        index = PillarIndex(get_test_data_folder('data_dup_domain'))
+        with self.assertRaises(TaskError) as cm:
+            index.minion_id('kb_couk')
+        self.assertIn("'kb_couk' is ambiguous", cm.exception.value)
+
+    def test_minion_id_not_found(self):
+        index = PillarIndex(get_test_data_folder('data'))
+        with self.assertRaises(TaskError) as cm:
+            index.minion_id('cswsite_doesnotexist')
+        self.assertIn("cannot find 'cswsite_doesnotexist'", cm.exception.value)
+
+    def test_minion_id_testing(self):
+        index = PillarIndex(get_test_data_folder('data_testing'))
+        self.assertEqual('drop', index.minion_id('kb_couk'))
+        self.assertEqual('drop-test', index.minion_id('kb_couk', testing=True))
+
+    def test_minions(self):
+        index = PillarIndex(get_test_data_folder('data_testing'))
+        self.assertEqual(['drop', 'drop-test'], index.minions('kb_couk'))
+
+    def test_sls(self):
+        index = PillarIndex(get_test_data_folder('data_testing'))
+        self.assertEqual(
+            ['config.django', 'db.settings', 'sites.kb'],
+            index.sls('drop')
+        )
+
+
+class TestTopMatcher(unittest.TestCase):
+
+    def _matcher(self):
+        # the targets are applied in the order they are in 'top.sls'
+        return TopMatcher(collections.OrderedDict([
+            ('drop-*', ['config.django']),
+            ('drop-temp,web', ['sites.four']),
+            ('drop,drop-test', [{'match': 'list'}, 'sites.kb']),
+            ('web-[0-9]+', [{'match': 'pcre'}, 'sites.pk']),
+        ]))
+
+    def test_minion_ids(self):
+        self.assertEqual(
+            ['drop', 'drop-temp', 'drop-test', 'web'],
+            self._matcher().minion_ids()
+        )
+
+    def test_sls(self):
+        self.assertEqual(
+            ['config.django', 'sites.four'],
+            self._matcher().sls('drop-temp')
+        )
+
+    def test_sls_list(self):
+        matcher = self._matcher()
+        self.assertEqual(['sites.kb'], matcher.sls('drop'))
+        self.assertEqual(
+            ['config.django', 'sites.kb'],
+            matcher.sls('drop-test')
+        )
+
+    def test_sls_pcre(self):
+        matcher = self._matcher()
+        self.assertEqual(['sites.pk'], matcher.sls('web-12'))
+        self.assertEqual([], matcher.sls('web-test'))
@@ -0,0 +1,146 @@
+# -*- encoding: utf-8 -*-
+import os
+import tempfile
+
+from lib.postgres import (
+    _remote_drop,
+    CatalogSnapshot,
+    dump_format,
+    missing_dbs,
+    reassign_batches,
+    RemoteSql,
+)
+from lib.siteinfo import SiteInfo
+from test.lib.test_siteinfo import (
+    get_site_info,
+    get_test_data_folder,
+)
+
+
+def test_remote_sql_parse():
+    batch = RemoteSql(get_site_info())
+    batch.add("SELECT COUNT(*) FROM pg_user WHERE usename = 'csw_web'")
+    batch.add("DROP ROLE IF EXISTS csw_web;")
+    batch.add("SELECT datname FROM pg_database")
+    out = '\r\n'.join([
+        '__fabric_sql_0__',
+        '1',
+        '__fabric_sql_1__',
+        '__fabric_sql_2__',
+        'postgres',
+        'csw_web',
+    ])
+    assert ['1', '', 'postgres\ncsw_web'] == batch.parse(out)
+
+
+def test_remote_sql_script():
+    batch = RemoteSql(get_site_info())
+    assert 0 == batch.add("SELECT COUNT(*) FROM pg_database")
+    assert 1 == batch.add("CREATE DATABASE csw_web;")
+    assert 2 == len(batch)
+    expect = '\n'.join([
+        '\\echo __fabric_sql_0__',
+        'SELECT COUNT(*) FROM pg_database;',
+        '\\echo __fabric_sql_1__',
+        'CREATE DATABASE csw_web;',
+    ])
+    assert expect == batch.script()
+
+
+def test_dump_format():
+    module_folder = os.path.dirname(os.path.realpath(__file__))
+    file_name = os.path.join(
+        module_folder, 'data', 'duplicity', 'restore_to', '20150124_0100.sql'
+    )
+    assert 'plain' == dump_format(file_name)
+
+
+def test_dump_format_custom():
+    handle, file_name = tempfile.mkstemp()
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(b'PGDMP\x01\x0c')
+        assert 'custom' == dump_format(file_name)
+    finally:
+        os.remove(file_name)
+
+
+def test_missing_dbs():
+    pillar_folder = get_test_data_folder('data')
+    csw_mail = SiteInfo('drop-temp', 'csw_mail', pillar_folder)
+    csw_web = SiteInfo('drop-temp', 'csw_web', pillar_folder)
+    result = missing_dbs(
+        [csw_mail, csw_web],
+        set(['postgres', 'csw_mail']),
+        set(['postgres', 'csw_mail', 'csw_web']),
+    )
+    assert [(csw_web, True, False)] == result
+
+
+def test_reassign_batches():
+    relations = {
+        'public': [('contact', 'r'), ('contact_id_seq', 'S')],
+        'my "schema"': [('report', 'v')],
+    }
+    result = reassign_batches(relations, 'patrick', batch_size=1)
+    assert [
+        ['ALTER VIEW "my ""schema"""."report" OWNER TO patrick'],
+        ['ALTER TABLE "public"."contact" OWNER TO patrick'],
+        ['ALTER SEQUENCE "public"."contact_id_seq" OWNER TO patrick'],
+    ] == result
+
+
+def test_catalog_snapshot():
+    out = '\r\n'.join([
+        'role|postgres||',
+        'role|csw_web||',
+        'database|postgres|postgres|7205380',
+        'database|csw_web|csw_web|15000000',
+        'database|template0|postgres|',
+    ])
+    snapshot = CatalogSnapshot(out)
+    assert snapshot.user_exists('csw_web')
+    assert not snapshot.user_exists('csw_mail')
+    assert snapshot.database_exists('csw_web')
+    assert 'csw_web' == snapshot.database_owner('csw_web')
+    assert 15000000 == snapshot.database_size('csw_web')
+    assert snapshot.database_size('template0') is None
+
+
+def test_remote_sql_ddl():
+    assert RemoteSql.DDL.match('CREATE DATABASE csw_web')
+    assert RemoteSql.DDL.match('drop role csw_web')
+    assert not RemoteSql.DDL.match("SELECT 'CREATE'")
+
+
+class OneSession(RemoteSql):
+    """Count the remote sessions (rather than running 'psql')."""
+
+    def __init__(self, site_info, out):
+        super(OneSession, self).__init__(site_info)
+        self.out = out
+        self.sessions = []
+
+    def run(self):
+        self.sessions.append(self.script())
+        result = self.parse(self.out)
+        self._statements = []
+        return result
+
+
+def test_remote_drop():
+    """The catalog is read in the same session as the 'DROP'."""
+    out = '\n'.join([
+        '__fabric_sql_0__',
+        'role|csw_web||',
+        'database|csw_web|csw_web|15000000',
+        '__fabric_sql_1__',
+    ])
+    batch = OneSession(get_site_info(), out)
+    assert _remote_drop(
+        batch,
+        lambda snapshot: snapshot.database_exists('csw_web'),
+        'DROP DATABASE IF EXISTS csw_web',
+    )
+    assert 1 == len(batch.sessions)
+    assert 'DROP DATABASE IF EXISTS csw_web;' in batch.sessions[0]
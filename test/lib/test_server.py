@@ -1,12 +1,51 @@
 import os
 import unittest
 
+from lib.error import TaskError
 from lib.folder import get_pillar_folder
-from lib.server import get_server_name
+from lib.server import (
+    get_live_sites,
+    get_postgres_sites,
+    get_server_name,
+    get_server_name_test,
+)
 
 
 class TestName(unittest.TestCase):
 
+    def test_live_sites(self):
+        module_folder = os.path.dirname(os.path.realpath(__file__))
+        folder = os.path.join(module_folder, 'data', 'sites', 'data_testing')
+        site_infos = get_live_sites(folder)
+        self.assertEqual(
+            [('drop', 'kb_couk'), ('drop', 'kbnot_couk')],
+            [(s.minion_id(), s.domain) for s in site_infos]
+        )
+
+    def test_live_sites_share_settings(self):
+        """The sites on a minion share one copy of the minion settings."""
+        module_folder = os.path.dirname(os.path.realpath(__file__))
+        folder = os.path.join(module_folder, 'data', 'sites', 'data_testing')
+        first, second = get_live_sites(folder)
+        self.assertIs(first._pillar, second._pillar)
+        self.assertNotIn('sites', first._pillar)
+
+    def test_postgres_sites(self):
+        module_folder = os.path.dirname(os.path.realpath(__file__))
+        folder = os.path.join(module_folder, 'data', 'sites', 'data')
+        site_infos = get_postgres_sites(folder, 'drop-temp')
+        self.assertEqual(
+            ['csw_mail', 'csw_web'],
+            [site_info.domain for site_info in site_infos]
+        )
+
+    def test_postgres_sites_no_minion(self):
+        module_folder = os.path.dirname(os.path.realpath(__file__))
+        folder = os.path.join(module_folder, 'data', 'sites', 'data')
+        with self.assertRaises(TaskError) as cm:
+            get_postgres_sites(folder, 'drop-doesnotexist')
+        self.assertIn("'drop-doesnotexist'", cm.exception.value)
+
     def test_name(self):
         module_folder = os.path.dirname(os.path.realpath(__file__))
         folder = os.path.join(module_folder, 'data', 'sites', 'data')
@@ -5,7 +5,10 @@ from lib.error import (
     SiteNotFoundError,
     TaskError,
 )
-from lib.siteinfo import SiteInfo
+from lib.siteinfo import (
+    SiteInfo,
+    SiteRecord,
+)
 
 
 def get_test_cert_folder(folder_name):
@@ -190,6 +193,14 @@ class TestSiteInfo(unittest.TestCase):
         }
         self.assertDictEqual(expected, get_site_info().env())
 
+    def test_env_cached(self):
+        site_info = get_site_info()
+        self.assertIs(site_info.env(), site_info.env())
+
+    def test_env_immutable(self):
+        with self.assertRaises(TypeError):
+            get_site_info().env()['DOMAIN'] = 'hatherleigh.info'
+
     def test_env_ssl_false(self):
         site_info = SiteInfo(
             'drop-temp',
@@ -469,3 +480,29 @@ class TestSiteInfo(unittest.TestCase):
             get_test_cert_folder('cert')
         )
         self.assertEqual('https://test.kbsoftware.co.uk/', info.url)
+
+
+class TestSiteRecord(unittest.TestCase):
+
+    def test_contains(self):
+        record = SiteRecord({'profile': 'django', 'secret_key': 'abc'})
+        self.assertIn('profile', record)
+        self.assertNotIn('celery', record)
+        # we don't keep settings which are not used
+        self.assertNotIn('secret_key', record)
+
+    def test_get(self):
+        record = SiteRecord({'profile': 'django', 'ssl': False})
+        self.assertEqual('django', record.get('profile'))
+        self.assertFalse(record.get('ssl', True))
+        self.assertTrue(record.get('compress', True))
+        self.assertIsNone(record.get('secret_key'))
+
+    def test_keys(self):
+        record = SiteRecord({'ssl': True, 'profile': 'django', 'mail': {}})
+        self.assertEqual(['profile', 'ssl'], record.keys())
+
+    def test_slots(self):
+        record = SiteRecord({})
+        with self.assertRaises(AttributeError):
+            record.domain = 'hatherleigh.info'
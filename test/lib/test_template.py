@@ -0,0 +1,63 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib.template import (
+    dump_hash,
+    template_name,
+    TemplateRegistry,
+)
+
+
+class TestTemplateRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.folder, 'templates.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, name, text):
+        file_name = os.path.join(self.folder, name)
+        with open(file_name, 'w') as f:
+            f.write(text)
+        return file_name
+
+    def test_dump_hash(self):
+        a = self._write('a.sql', 'SELECT 1;')
+        b = self._write('b.sql', 'SELECT 1;')
+        c = self._write('c.sql', 'SELECT 2;')
+        self.assertEqual(dump_hash(a), dump_hash(b))
+        self.assertNotEqual(dump_hash(a), dump_hash(c))
+
+    def test_evict(self):
+        registry = TemplateRegistry(self.file_name, budget=100)
+        registry.add('template_a', 'a', 50, 'kb_couk', used=1)
+        registry.add('template_b', 'b', 50, 'kb_couk', used=2)
+        registry.add('template_c', 'c', 50, 'kb_couk', used=3)
+        registry.touch('template_a', used=4)
+        self.assertEqual(['template_b'], registry.evict())
+        self.assertEqual(['template_a', 'template_c'], registry.names())
+
+    def test_evict_keep(self):
+        registry = TemplateRegistry(self.file_name, budget=100)
+        registry.add('template_a', 'a', 150, 'kb_couk', used=1)
+        self.assertEqual([], registry.evict(keep='template_a'))
+        self.assertIn('template_a', registry)
+
+    def test_save(self):
+        registry = TemplateRegistry(self.file_name)
+        registry.add('template_a', 'a', 50, 'kb_couk')
+        registry.save()
+        registry = TemplateRegistry(self.file_name)
+        self.assertEqual(['template_a'], registry.names())
+        self.assertEqual(50, registry.size())
+
+    def test_template_name(self):
+        self.assertEqual(
+            'template_0123456789abcdef',
+            template_name('0123456789abcdef0123'),
+        )
@@ -0,0 +1,43 @@
+# -*- encoding: utf-8 -*-
+from lib.validate import validate_all
+from test.lib.test_siteinfo import get_test_data_folder
+
+
+def test_validate_all():
+    assert [] == validate_all(get_test_data_folder('data'), processes=1)
+
+
+def test_validate_all_invalid():
+    result = validate_all(
+        get_test_data_folder('data_dup_uwsgi_port'),
+        processes=1
+    )
+    assert 1 == len(result)
+    minion_id, message = result[0]
+    assert 'drop-temp' == minion_id
+    assert 'has the same uWSGI port number' in message
+
+
+def test_validate_all_conflict():
+    result = validate_all(get_test_data_folder('data_dup_db_user'), processes=1)
+    assert 1 == len(result)
+    minion_id, message = result[0]
+    assert 'drop, drop-temp' == minion_id
+    assert "'db_user' kb is used by more than one site" in message
+
+
+def test_validate_all_pool():
+    """Two minions ('drop-*' is not a minion), so use a pool."""
+    result = validate_all(get_test_data_folder('data_php'), processes=2)
+    assert [] == result
+
+
+def test_validate_all_parse_error():
+    """Report every minion (even if an 'sls' file is broken or missing)."""
+    result = validate_all(
+        get_test_data_folder('data_invalid_yaml'),
+        processes=1
+    )
+    assert ['drop-temp', 'drop-test'] == [minion_id for minion_id, e in result]
+    assert 'pk.sls' in result[0][1]
+    assert 'hatherleigh.sls' in result[1][1]
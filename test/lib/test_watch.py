@@ -0,0 +1,113 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib.watch import PillarWatcher
+from test.lib.test_siteinfo import get_test_data_folder
+
+
+class TestPillarWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = os.path.join(tempfile.mkdtemp(), 'pillar')
+        shutil.copytree(get_test_data_folder('data_testing'), self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.folder))
+
+    def _write(self, name, text):
+        with open(os.path.join(self.folder, name), 'w') as f:
+            f.write(text)
+
+    def test_poll(self):
+        watcher = PillarWatcher(self.folder)
+        view = watcher.poll()
+        self.assertEqual(1, view.version)
+        self.assertEqual(('drop', 'drop-test'), view.changed)
+        self.assertEqual(['drop', 'drop-test'], sorted(view.pillars.keys()))
+        self.assertTrue(view.is_valid)
+        # nothing has changed
+        self.assertIsNone(watcher.poll())
+
+    def test_poll_changed(self):
+        watcher = PillarWatcher(self.folder)
+        watcher.poll()
+        # only 'drop-test' uses the 'testing' config
+        self._write(
+            os.path.join('config', 'testing.sls'),
+            'testing:\n  False\n',
+        )
+        view = watcher.poll()
+        self.assertEqual(2, view.version)
+        self.assertEqual(('drop-test',), view.changed)
+        self.assertFalse(view.pillars['drop-test']['testing'])
+
+    def test_poll_invalid(self):
+        watcher = PillarWatcher(self.folder)
+        watcher.poll()
+        self._write(
+            os.path.join('db', 'settings.sls'),
+            'postgres_settings:\n  listen_address:\n',
+        )
+        view = watcher.poll()
+        self.assertEqual(('drop', 'drop-test'), view.changed)
+        self.assertFalse(view.is_valid)
+        self.assertEqual(['drop', 'drop-test'], [m for m, e in view.errors])
+
+    def test_poll_missing(self):
+        """An 'sls' file in 'top.sls' has been removed."""
+        watcher = PillarWatcher(self.folder)
+        watcher.poll()
+        os.remove(os.path.join(self.folder, 'config', 'testing.sls'))
+        view = watcher.poll()
+        self.assertFalse(view.is_valid)
+        self.assertEqual(['drop-test'], [m for m, e in view.errors])
+        self.assertIn('testing.sls', view.errors[0][1])
+        self.assertEqual(['drop'], list(view.pillars.keys()))
+
+    def test_poll_parse_error(self):
+        """The 'sls' file is being edited (and is not valid YAML)."""
+        watcher = PillarWatcher(self.folder)
+        watcher.poll()
+        self._write(
+            os.path.join('config', 'testing.sls'),
+            'testing: [True\n',
+        )
+        view = watcher.poll()
+        self.assertEqual(['drop-test'], [m for m, e in view.errors])
+        self.assertIn('testing.sls', view.errors[0][1])
+        # fixed
+        self._write(
+            os.path.join('config', 'testing.sls'),
+            'testing:\n  True\n',
+        )
+        view = watcher.poll()
+        self.assertEqual(('drop-test',), view.changed)
+        self.assertTrue(view.is_valid)
+
+    def test_poll_top_parse_error(self):
+        watcher = PillarWatcher(self.folder)
+        watcher.poll()
+        self._write('top.sls', "base:\n  'drop': [\n")
+        view = watcher.poll()
+        self.assertEqual(2, view.version)
+        self.assertFalse(view.is_valid)
+        self.assertEqual(['top.sls'], [m for m, e in view.errors])
+        self.assertEqual({}, view.pillars)
+        # nothing has changed
+        self.assertIsNone(watcher.poll())
+        # fixed, so every minion is checked
+        shutil.copy(
+            os.path.join(get_test_data_folder('data_testing'), 'top.sls'),
+            os.path.join(self.folder, 'top.sls'),
+        )
+        view = watcher.poll()
+        self.assertEqual(('drop', 'drop-test'), view.changed)
+        self.assertTrue(view.is_valid)
+
+    def test_view_immutable(self):
+        view = PillarWatcher(self.folder).poll()
+        with self.assertRaises(TypeError):
+            view.pillars['drop'] = {}
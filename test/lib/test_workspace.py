@@ -0,0 +1,164 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from lib.error import TaskError
+from lib.workspace import (
+    copy_and_remove,
+    free_space,
+    move,
+    same_file_system,
+    workspace_root,
+    Workspaces,
+)
+
+
+class TestWorkspaces(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, folder, size):
+        with open(os.path.join(folder, 'data.sql'), 'w') as f:
+            f.write('x' * size)
+
+    def _workspace(self, workspaces, name, size, used):
+        """A workspace which has been used and released."""
+        folder = workspaces.create(name)
+        self._write(folder, size)
+        workspaces.release(folder)
+        os.utime(folder, (used, used))
+        return folder
+
+    def test_abandoned(self):
+        """The restore which was using the workspace has finished."""
+        workspaces = Workspaces(self.root, keep=0, min_free=0)
+        folder = workspaces.create('kb_couk')
+        process = subprocess.Popen(['true'])
+        process.wait()
+        with open(folder + '.pid', 'w') as f:
+            f.write(str(process.pid))
+        self.assertFalse(workspaces.in_use(folder))
+        self.assertEqual([folder], workspaces.cleanup())
+
+    def test_budget(self):
+        workspaces = Workspaces(self.root, budget=150, keep=3, min_free=0)
+        a = self._workspace(workspaces, 'a', 100, 1)
+        b = workspaces.create('b')
+        self._write(b, 100)
+        # 'b' is in use
+        self.assertEqual([], workspaces.cleanup())
+        # 'a' and 'b' do not fit in the budget
+        self.assertEqual([a], workspaces.release(b))
+        self.assertTrue(os.path.exists(b))
+
+    def test_create_empty(self):
+        """duplicity will only restore a collection into an empty folder."""
+        workspaces = Workspaces(self.root, min_free=0)
+        folder = workspaces.create('kb_couk')
+        self.assertEqual([], os.listdir(folder))
+        self.assertTrue(workspaces.in_use(folder))
+        workspaces.release(folder)
+        self.assertFalse(os.path.exists(folder + '.pid'))
+
+    def test_create_not_enough_space(self):
+        workspaces = Workspaces(self.root, min_free=0)
+        with self.assertRaises(TaskError) as cm:
+            workspaces.create('kb_couk', free_space(self.root) * 2)
+        self.assertIn('Not enough free space', cm.exception.value)
+
+    def test_in_use(self):
+        """Never remove the workspace of a restore which is running."""
+        workspaces = Workspaces(self.root, keep=0, min_free=0)
+        a = workspaces.create('a')
+        b = workspaces.create('b')
+        self.assertTrue(workspaces.in_use(a))
+        self.assertEqual([b], workspaces.release(b))
+        self.assertTrue(os.path.exists(a))
+
+    def test_keep(self):
+        workspaces = Workspaces(self.root, keep=2, min_free=0)
+        a = self._workspace(workspaces, 'a', 10, 1)
+        b = self._workspace(workspaces, 'b', 10, 2)
+        c = self._workspace(workspaces, 'c', 10, 3)
+        # the old workspace was removed to make room for 'c'
+        self.assertFalse(os.path.exists(a))
+        self.assertEqual(
+            [c, b],
+            [folder for used, folder, size in workspaces.workspaces()]
+        )
+
+    def test_keep_none(self):
+        workspaces = Workspaces(self.root, keep=0, min_free=0)
+        folder = workspaces.create('kb_couk')
+        self.assertEqual([folder], workspaces.release(folder))
+        self.assertEqual([], workspaces.workspaces())
+
+    def test_not_ours(self):
+        """Only remove the folders we created."""
+        other = os.path.join(self.root, 'other')
+        os.makedirs(other)
+        workspaces = Workspaces(self.root, keep=0, min_free=0)
+        folder = workspaces.create('kb_couk')
+        self.assertEqual([folder], workspaces.release(folder))
+        self.assertTrue(os.path.exists(other))
+
+
+class TestMove(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, *names):
+        file_name = os.path.join(self.folder, *names)
+        if not os.path.exists(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+        with open(file_name, 'w') as f:
+            f.write('x' * 10)
+        return file_name
+
+    def test_copy_and_remove(self):
+        self._write('restore', 'booking', 'a.png')
+        self._write('restore', 'booking', 'b.png')
+        from_folder = os.path.join(self.folder, 'restore', 'booking')
+        to_folder = os.path.join(self.folder, 'media', 'booking')
+        os.makedirs(os.path.dirname(to_folder))
+        self.assertEqual(20, copy_and_remove((from_folder, to_folder)))
+        self.assertFalse(os.path.exists(from_folder))
+        self.assertEqual(['a.png', 'b.png'], sorted(os.listdir(to_folder)))
+
+    def test_move(self):
+        from_file = self._write('restore', 'compose', 'a.png')
+        to_folder = os.path.join(self.folder, 'media', 'compose')
+        result = move([(os.path.dirname(from_file), to_folder)])
+        self.assertEqual(dict(bytes=0, copied=0, renamed=1), result)
+        self.assertTrue(os.path.exists(os.path.join(to_folder, 'a.png')))
+
+    def test_same_file_system(self):
+        self.assertTrue(same_file_system(
+            self.folder, os.path.join(self.folder, 'does', 'not', 'exist')
+        ))
+
+    def test_workspace_root(self):
+        # use a cache folder in our temporary folder (not '~/.cache')
+        environ = dict(os.environ)
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self.folder, 'cache')
+        os.environ.pop('RESTORE_FOLDER', None)
+        try:
+            project = os.path.join(self.folder, 'dev', 'project', 'kb_couk')
+            root = workspace_root(near=project)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+        self.assertTrue(root.startswith(self.folder))
+        self.assertTrue(os.path.isdir(root))
+        self.assertTrue(same_file_system(root, project))